@@ -0,0 +1,112 @@
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List
+from benchmarks.fakes import FakeLatency, fake_vector, fake_score
+
+class FakeUpstreamServer:
+    def __init__(self, port: int = 0, dim: int = 256, embed_latency: FakeLatency = None,
+                 rerank_latency: FakeLatency = None, throttle_rate: float = 0.0,
+                 retry_after: float = 0.05, seed: int = 42):
+        self.dim = dim
+        self.embed_latency = embed_latency or FakeLatency()
+        self.rerank_latency = rerank_latency or FakeLatency()
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.embedding_calls: List[int] = []
+        self.rerank_calls: List[int] = []
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _throttle(self) -> bool:
+        with self._lock:
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                self.throttled += 1
+                return True
+            return False
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status: int, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if server._throttle():
+                    self._send(429, {"error": {"message": "rate limited"}}, {"Retry-After": str(server.retry_after)})
+                    return
+
+                if self.path.endswith("/rerank"):
+                    documents = body["documents"]
+                    time.sleep(server.rerank_latency.seconds(len(documents)))
+                    server.rerank_calls.append(len(documents))
+                    self._send(200, {
+                        "id": "rerank",
+                        "object": "rerank",
+                        "model": body.get("model"),
+                        "results": [
+                            {"index": i, "relevance_score": fake_score(body["query"], text)}
+                            for i, text in enumerate(documents)
+                        ]
+                    })
+                elif self.path.endswith("/embeddings"):
+                    texts = body["input"]
+                    texts = [texts] if isinstance(texts, str) else texts
+                    time.sleep(server.embed_latency.seconds(len(texts)))
+                    server.embedding_calls.append(len(texts))
+                    self._send(200, {
+                        "object": "list",
+                        "model": body.get("model"),
+                        "data": [
+                            {"object": "embedding", "index": i, "embedding": fake_vector(text, server.dim)}
+                            for i, text in enumerate(texts)
+                        ],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0}
+                    })
+                else:
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        return {
+            "embedding_calls": len(self.embedding_calls),
+            "embedded_texts": sum(self.embedding_calls),
+            "rerank_calls": len(self.rerank_calls),
+            "reranked_documents": sum(self.rerank_calls),
+            "throttled": self.throttled
+        }
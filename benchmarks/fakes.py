@@ -0,0 +1,105 @@
+import time
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import List
+import numpy as np
+from services.embedder import Embedder
+from services.reranker import Reranker
+
+def fake_vector(text: str, dim: int) -> List[float]:
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def fake_score(query: str, text: str) -> float:
+    digest = hashlib.blake2b(query.encode("utf-8") + b"\0" + text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2 ** 64
+
+class FakeLatency:
+    def __init__(self, base_ms: float = 0, per_item_ms: float = 0):
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+
+    def seconds(self, items: int) -> float:
+        return (self.base_ms + self.per_item_ms * items) / 1000
+
+class _FakeEmbeddings:
+    def __init__(self, dim: int, latency: FakeLatency, calls: List[int]):
+        self.dim = dim
+        self.latency = latency
+        self.calls = calls
+
+    def _response(self, texts: List[str]):
+        self.calls.append(len(texts))
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_vector(text, self.dim)) for i, text in enumerate(texts)
+        ])
+
+    def create(self, input, model=None, **kwargs):
+        texts = [input] if isinstance(input, str) else input
+        time.sleep(self.latency.seconds(len(texts)))
+        return self._response(texts)
+
+class _AsyncFakeEmbeddings(_FakeEmbeddings):
+    async def create(self, input, model=None, **kwargs):
+        texts = [input] if isinstance(input, str) else input
+        await asyncio.sleep(self.latency.seconds(len(texts)))
+        return self._response(texts)
+
+class _FakeRerank:
+    def __init__(self, latency: FakeLatency, calls: List[int]):
+        self.latency = latency
+        self.calls = calls
+
+    def _response(self, query: str, documents: List[str]):
+        self.calls.append(len(documents))
+        return SimpleNamespace(results=[
+            SimpleNamespace(index=i, relevance_score=fake_score(query, text)) for i, text in enumerate(documents)
+        ])
+
+    def create(self, model=None, query="", documents=None, **kwargs):
+        time.sleep(self.latency.seconds(len(documents)))
+        return self._response(query, documents)
+
+class _AsyncFakeRerank(_FakeRerank):
+    async def create(self, model=None, query="", documents=None, **kwargs):
+        await asyncio.sleep(self.latency.seconds(len(documents)))
+        return self._response(query, documents)
+
+class _FakeClient:
+    def __init__(self, **endpoints):
+        for name, endpoint in endpoints.items():
+            setattr(self, name, endpoint)
+
+    def close(self):
+        pass
+
+class _AsyncFakeClient(_FakeClient):
+    async def close(self):
+        pass
+
+class FakeProviders:
+    def __init__(self, dim: int = 256, embed_latency: FakeLatency = None, rerank_latency: FakeLatency = None):
+        self.dim = dim
+        self.embed_latency = embed_latency or FakeLatency()
+        self.rerank_latency = rerank_latency or FakeLatency()
+        self.embedding_calls: List[int] = []
+        self.rerank_calls: List[int] = []
+
+    def install(self):
+        embedder = Embedder()
+        embedder._client = _FakeClient(embeddings=_FakeEmbeddings(self.dim, self.embed_latency, self.embedding_calls))
+        embedder._async_client = _AsyncFakeClient(embeddings=_AsyncFakeEmbeddings(self.dim, self.embed_latency, self.embedding_calls))
+
+        reranker = Reranker()
+        reranker._client = _FakeClient(rerank=_FakeRerank(self.rerank_latency, self.rerank_calls))
+        reranker._async_client = _AsyncFakeClient(rerank=_AsyncFakeRerank(self.rerank_latency, self.rerank_calls))
+
+    def stats(self):
+        return {
+            "embedding_calls": len(self.embedding_calls),
+            "embedded_texts": sum(self.embedding_calls),
+            "rerank_calls": len(self.rerank_calls),
+            "reranked_documents": sum(self.rerank_calls)
+        }
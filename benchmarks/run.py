@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+# Running the file directly puts benchmarks/ rather than the repo root on the path.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "pen", "dor", "qua", "lix", "mor", "sen", "tu", "bra"]
+WORKLOADS = ("ingest", "query", "rerank", "mixed")
+MIXED_WEIGHTS = {"query": 0.8, "rerank": 0.15, "ingest": 0.05}
+
+def make_vocabulary(rng: random.Random, size: int = 2000) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_text(rng: random.Random, vocabulary: List[str], low: int, high: int) -> str:
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(low, high)))
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": float(values.mean()),
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max())
+        },
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+class Benchmark:
+    def __init__(self, http, args, vocabulary: List[str]):
+        self.http = http
+        self.args = args
+        self.vocabulary = vocabulary
+        self._ingested = 0
+
+    def _documents(self, rng: random.Random, count: int):
+        start = self._ingested
+        self._ingested += count
+        return {
+            "documents": [make_text(rng, self.vocabulary, 8, 40) for _ in range(count)],
+            "metadatas": [{"source": "bench", "shard": (start + i) % 8} for i in range(count)],
+            "ids": [f"doc-{start + i}" for i in range(count)]
+        }
+
+    def _request(self, rng: random.Random, backend: str, collection: str, kind: str):
+        params = {"vector_store": backend}
+        if kind == "ingest":
+            return "POST", f"/collections/{collection}/add", params, self._documents(rng, self.args.ingest_batch)
+        return "POST", f"/collections/{collection}/query", params, {
+            "query_texts": [make_text(rng, self.vocabulary, 3, 8)],
+            "n_results": self.args.n_results,
+            "rerank": kind == "rerank"
+        }
+
+    async def _send(self, method: str, path: str, params: Dict[str, Any], body: Any):
+        response = await self.http.request(method, path, params=params, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} failed with {response.status_code}: {response.text[:200]}")
+        return response
+
+    async def setup(self, backend: str, collection: str):
+        await self.http.delete(f"/collections/{collection}", params={"vector_store": backend})
+        await self._send("POST", f"/collections/{collection}", {"vector_store": backend}, None)
+        rng = random.Random(self.args.seed)
+        remaining = self.args.corpus_size
+        while remaining > 0:
+            count = min(256, remaining)
+            await self._send("POST", f"/collections/{collection}/add", {"vector_store": backend}, self._documents(rng, count))
+            remaining -= count
+
+    async def scenario(self, backend: str, collection: str, workload: str, concurrency: int) -> Dict[str, Any]:
+        rng = random.Random(f"{self.args.seed}:{backend}:{workload}:{concurrency}")
+        kinds = [workload] * self.args.requests
+        if workload == "mixed":
+            kinds = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()), k=self.args.requests)
+        requests = [self._request(rng, backend, collection, kind) for kind in kinds]
+        for _ in range(self.args.warmup):
+            await self._send(*self._request(rng, backend, collection, workload if workload != "mixed" else "query"))
+
+        latencies: List[float] = []
+        errors = 0
+        queue = asyncio.Queue()
+        for request in requests:
+            queue.put_nowait(request)
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                request = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    await self._send(*request)
+                except Exception as e:
+                    errors += 1
+                    if errors == 1:
+                        print(f"[{backend}/{workload}/c{concurrency}] {str(e)}", file=sys.stderr)
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result = summarize(latencies, errors, time.perf_counter() - start)
+        result.update({"backend": backend, "workload": workload, "concurrency": concurrency})
+        return result
+
+def configure_environment(args, data_dir: str):
+    os.environ["CHROMA_PATH"] = os.path.join(data_dir, "chroma")
+    os.environ["LOCAL_STORE_PATH"] = os.path.join(data_dir, "local")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    os.environ.setdefault("NVIDIA_API_KEY", "benchmark")
+    os.environ.setdefault("TOGETHER_API_KEY", "benchmark")
+    os.environ["EMBEDDING_DIMENSION"] = str(args.dim)
+    if not args.result_cache:
+        os.environ["RESULT_CACHE_MAX_ENTRIES"] = "0"
+    else:
+        os.environ.setdefault("RESULT_CACHE_SINGLE_WORKER", "true")
+
+def make_providers(args):
+    from benchmarks.fakes import FakeProviders, FakeLatency
+    embed_latency = FakeLatency(args.embed_latency_ms, args.embed_latency_per_item_ms)
+    rerank_latency = FakeLatency(args.rerank_latency_ms, args.rerank_latency_per_item_ms)
+    if args.upstream == "server":
+        from benchmarks.fake_server import FakeUpstreamServer
+        server = FakeUpstreamServer(
+            dim=args.dim,
+            embed_latency=embed_latency,
+            rerank_latency=rerank_latency,
+            throttle_rate=args.throttle_rate,
+            retry_after=args.retry_after,
+            seed=args.seed
+        ).start()
+        os.environ["EMBEDDING_BASE_URL"] = server.url
+        os.environ["RERANKER_BASE_URL"] = server.url
+        return server
+    return FakeProviders(dim=args.dim, embed_latency=embed_latency, rerank_latency=rerank_latency)
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+    providers = make_providers(args)
+    from main import app
+
+    vocabulary = make_vocabulary(random.Random(args.seed))
+    results = []
+    skipped = {}
+
+    async with app.router.lifespan_context(app):
+        if hasattr(providers, "install"):
+            providers.install()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+            bench = Benchmark(http, args, vocabulary)
+            for backend in args.backends:
+                if backend == "milvus" and not (os.getenv("MILVUS_URI") and os.getenv("MILVUS_TOKEN")):
+                    skipped[backend] = "MILVUS_URI/MILVUS_TOKEN not set"
+                    continue
+                collection = f"bench_{backend}"
+                print(f"Preparing {backend} with {args.corpus_size} documents", file=sys.stderr)
+                await bench.setup(backend, collection)
+                for workload in args.workloads:
+                    for concurrency in args.concurrency:
+                        result = await bench.scenario(backend, collection, workload, concurrency)
+                        print(
+                            f"{backend:>7} {workload:>7} c={concurrency:<4} "
+                            f"{result['throughput_rps']:9.1f} req/s  p50={result['latency_ms']['p50']:.2f}ms "
+                            f"p95={result['latency_ms']['p95']:.2f}ms  p99={result['latency_ms']['p99']:.2f}ms",
+                            file=sys.stderr
+                        )
+                        results.append(result)
+                await http.delete(f"/collections/{collection}", params={"vector_store": backend})
+            cache_stats = (await http.get("/cache/stats")).json()
+            upstream_stats = (await http.get("/upstream/stats")).json()
+    if hasattr(providers, "stop"):
+        providers.stop()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        },
+        "results": results,
+        "skipped": skipped,
+        "providers": providers.stats(),
+        "cache": cache_stats,
+        "upstream": upstream_stats,
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    previous = {(r["backend"], r["workload"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["backend"], result["workload"], result["concurrency"]))
+        if before is None:
+            continue
+        throughput = result["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        p95 = result["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1 if before["latency_ms"]["p95"] else 0.0
+        result["change"] = {"throughput": throughput, "p95": p95}
+        if throughput < -threshold or p95 > threshold:
+            regressions.append(
+                f"{result['backend']}/{result['workload']}/c{result['concurrency']}: "
+                f"throughput {throughput:+.1%}, p95 {p95:+.1%}"
+            )
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the vector store API")
+    csv = lambda value: [item.strip() for item in value.split(",") if item.strip()]
+    parser.add_argument("--backends", type=csv, default=["local", "chroma"], help="Comma-separated: local, chroma, milvus")
+    parser.add_argument("--workloads", type=csv, default=list(WORKLOADS), help="Comma-separated: " + ", ".join(WORKLOADS))
+    parser.add_argument("--concurrency", type=lambda value: [int(item) for item in csv(value)], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each scenario")
+    parser.add_argument("--corpus-size", type=int, default=2000, help="Documents ingested before the scenarios run")
+    parser.add_argument("--ingest-batch", type=int, default=16, help="Documents per ingest request")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension")
+    parser.add_argument("--embed-latency-ms", type=float, default=5.0)
+    parser.add_argument("--embed-latency-per-item-ms", type=float, default=0.1)
+    parser.add_argument("--rerank-latency-ms", type=float, default=10.0)
+    parser.add_argument("--rerank-latency-per-item-ms", type=float, default=0.2)
+    parser.add_argument("--upstream", choices=["client", "server"], default="client",
+                        help="Fake providers in-process (client) or behind a local HTTP server (server)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of fake server calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with fake 429s")
+    parser.add_argument("--result-cache", action="store_true", help="Keep the query result cache enabled")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=None, help="Directory for on-disk stores (defaults to a temporary directory)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", default=None, help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change that counts as a regression")
+    args = parser.parse_args(argv)
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"Unknown workloads: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="vector-store-bench-") as tmp:
+        configure_environment(args, args.data_dir or tmp)
+        report = asyncio.run(run(args))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
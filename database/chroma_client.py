@@ -1,12 +1,35 @@
 import chromadb
 import os
-from typing import List, Dict, Any, Optional
-from utils import generate_embedding
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+from utils import generate_embeddings, rerank_results, get_result_cache
+from services.metrics import timed
+from .upsert import UpsertPlan, content_hash
+
+# Chroma merges upserted metadata into the stored one, so every row carries its content hash in metadata and
+# rows that lose metadata keys are rewritten. The stored state then always matches what the plan hashed.
+_HASH_FIELD = "_content_hash"
+
+def _public_metadata(metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not metadata or _HASH_FIELD not in metadata:
+        return metadata
+    metadata = {key: value for key, value in metadata.items() if key != _HASH_FIELD}
+    return metadata or None
 
 class ChromaClient:
+    vector_store = "chroma"
+
     def __init__(self, path: str = None):
         self.path = path or os.getenv("CHROMA_PATH", "/app/data")
         self.client = chromadb.PersistentClient(path=self.path)
+
+    def ping(self):
+        self.client.heartbeat()
+
+    def reconnect(self):
+        self.client = chromadb.PersistentClient(path=self.path)
+
+    def close(self):
+        self.client = None
     
     def list_collections(self) -> List[str]:
         collections = self.client.list_collections()
@@ -20,28 +43,71 @@ class ChromaClient:
     
     def delete_collection(self, name: str):
         self.client.delete_collection(name=name)
+        get_result_cache().bump(self.vector_store, name)
     
-    def add_documents(self, collection_name: str, documents: List[str], 
-                     metadatas: Optional[List[Dict[str, Any]]] = None,
-                     ids: Optional[List[str]] = None):
+    def plan_documents(self, collection_name: str, documents: List[str],
+                       metadatas: Optional[List[Dict[str, Any]]] = None,
+                       ids: Optional[List[str]] = None) -> UpsertPlan:
         collection = self.get_collection(name=collection_name)
-        
-        embeddings = [generate_embedding(doc) for doc in documents]
-        
-        collection.add(
-            documents=documents,
+        plan = UpsertPlan(collection_name, documents, metadatas, ids)
+        existing = collection.get(ids=plan.candidate_ids, include=["documents", "metadatas"])
+        hashes = {
+            id_: (metadata or {}).get(_HASH_FIELD) or content_hash(document, metadata)
+            for id_, document, metadata in zip(existing["ids"], existing["documents"], existing["metadatas"])
+        }
+        stored_keys = {id_: set(metadata or {}) - {_HASH_FIELD} for id_, metadata in zip(existing["ids"], existing["metadatas"])}
+        return plan.resolve(stored_keys, hashes)
+
+    def write_documents(self, plan: UpsertPlan, embeddings: Optional[List[List[float]]] = None,
+                        flush: bool = True) -> Dict[str, int]:
+        if not plan.ids:
+            return plan.summary()
+
+        collection = self.get_collection(name=plan.collection_name)
+        if embeddings is None:
+            embeddings = generate_embeddings(plan.documents)
+
+        # A merge cannot drop keys, so rows whose new metadata lacks some stored key are removed and re-added.
+        shrunk = [
+            id_ for id_, metadata in zip(plan.ids, plan.metadatas)
+            if id_ in plan.replaced and plan.replaced[id_] - set(metadata or {})
+        ]
+        if shrunk:
+            collection.delete(ids=shrunk)
+        collection.upsert(
+            documents=plan.documents,
             embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
+            metadatas=[{**(metadata or {}), _HASH_FIELD: hash_} for metadata, hash_ in zip(plan.metadatas, plan.content_hashes)],
+            ids=plan.ids
         )
+        stale = plan.stale_chunk_filter()
+        if stale:
+            collection.delete(where=stale)
+        get_result_cache().bump(self.vector_store, plan.collection_name)
+        return plan.summary()
+
+    def add_documents(self, collection_name: str, documents: List[str], 
+                     metadatas: Optional[List[Dict[str, Any]]] = None,
+                     ids: Optional[List[str]] = None,
+                     embeddings: Optional[List[List[float]]] = None,
+                     flush: bool = True):
+        plan = self.plan_documents(collection_name, documents, metadatas, ids)
+        return self.write_documents(plan, plan.select_embeddings(embeddings), flush=flush)
     
+    def flush(self, collection_name: str):
+        pass
+
     def query(self, collection_name: str, query_texts: List[str], 
               n_results: int = 10, where: Optional[Dict[str, Any]] = None,
               where_document: Optional[Dict[str, Any]] = None,
-              rerank: bool = False):
+              rerank: bool = False,
+              query_embeddings: Optional[List[List[float]]] = None,
+              rerank_top_m: Optional[int] = None,
+              recall: Optional[float] = None):
         collection = self.get_collection(name=collection_name)
         
-        query_embeddings = [generate_embedding(text) for text in query_texts]
+        if query_embeddings is None:
+            query_embeddings = generate_embeddings(query_texts)
         
         query_args = {
             "query_embeddings": query_embeddings,
@@ -53,24 +119,59 @@ class ChromaClient:
         if where_document and len(where_document) > 0:
             query_args["where_document"] = where_document
             
-        results = collection.query(**query_args)
+        with timed("search"):
+            results = collection.query(**query_args)
+        if results.get("metadatas"):
+            results["metadatas"] = [[_public_metadata(metadata) for metadata in row] for row in results["metadatas"]]
         
         if rerank and len(query_texts) > 0 and len(results["documents"]) > 0:
-            query = query_texts[0]
-            documents = results["documents"][0]
-            
-            if documents:
-                from utils import rerank_results
-                reranked_indices = rerank_results(query, documents)
+            for q, query in enumerate(query_texts):
+                documents = results["documents"][q]
+                if not documents:
+                    continue
                 
-                for key in results:
-                    if isinstance(results[key], list) and len(results[key]) > 0 and len(results[key][0]) > 0:
-                        results[key][0] = [results[key][0][i] for i in reranked_indices]
+                hits = [{
+                    "id": results["ids"][q][i],
+                    "text": documents[i],
+                    "metadata": (results["metadatas"][q][i] if results.get("metadatas") else None) or {},
+                    "index": i
+                } for i in range(len(documents))]
+                reranked_indices = [hit["index"] for hit in rerank_results(query, hits, top_m=rerank_top_m)]
                 
-                results["reranked"] = True
+                for key in results:
+                    if isinstance(results[key], list) and len(results[key]) > q and isinstance(results[key][q], list) and len(results[key][q]) == len(documents):
+                        results[key][q] = [results[key][q][i] for i in reranked_indices]
+            
+            results["reranked"] = True
         
         return results
     
+    def export_pages(self, collection_name: str, cursor: Optional[str] = None, batch_size: int = 1000,
+                     include_embeddings: bool = False) -> Iterator[Tuple[List[Dict[str, Any]], str]]:
+        collection = self.get_collection(name=collection_name)
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        offset = int(cursor or 0)
+        while True:
+            page = collection.get(limit=batch_size, offset=offset, include=include)
+            if not page["ids"]:
+                return
+            offset += len(page["ids"])
+            yield [{
+                "id": page["ids"][i],
+                "document": page["documents"][i],
+                "metadata": _public_metadata(page["metadatas"][i]),
+                **({"embedding": page["embeddings"][i]} if include_embeddings else {})
+            } for i in range(len(page["ids"]))], str(offset)
+            if len(page["ids"]) < batch_size:
+                return
+    
+    def distance_metric(self, collection_name: str) -> str:
+        collection = self.get_collection(name=collection_name)
+        return (collection.metadata or {}).get("hnsw:space", "l2")
+    
     def peek(self, collection_name: str, limit: int = 10):
         collection = self.get_collection(name=collection_name)
-        return collection.peek(limit=limit) 
\ No newline at end of file
+        results = collection.peek(limit=limit)
+        if results.get("metadatas"):
+            results["metadatas"] = [_public_metadata(metadata) for metadata in results["metadatas"]]
+        return results 
\ No newline at end of file
@@ -1,20 +1,97 @@
 import os
-from typing import Optional, Literal, Union
-from .chroma_client import ChromaClient
-from .milvus_client import MilvusClient
+import threading
+from typing import Optional, Literal, Union, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .chroma_client import ChromaClient
+    from .milvus_client import MilvusClient
+    from .local_client import LocalClient
 
 class VectorStoreFactory:
+    _clients: Dict[str, Union["ChromaClient", "MilvusClient", "LocalClient"]] = {}
+    _lock = threading.Lock()
+    _monitor: Optional[threading.Thread] = None
+    _stop_event = threading.Event()
+
     @staticmethod
-    def get_client(vector_store: Literal["chroma", "milvus"]) -> Optional[Union[ChromaClient, MilvusClient]]:
+    def _create_client(vector_store: str) -> Optional[Union["ChromaClient", "MilvusClient", "LocalClient"]]:
+        # Backend modules pull in heavy SDKs, so they are only imported once a backend is used.
         if vector_store == "chroma":
+            from .chroma_client import ChromaClient
             return ChromaClient()
         elif vector_store == "milvus":
             milvus_uri = os.getenv("MILVUS_URI")
             milvus_token = os.getenv("MILVUS_TOKEN")
-            
+
             if not milvus_uri or not milvus_token:
                 return None
-                
+
+            from .milvus_client import MilvusClient
             return MilvusClient(milvus_uri, milvus_token)
+        elif vector_store == "local":
+            from .local_client import LocalClient
+            return LocalClient()
         else:
-            raise ValueError(f"Unsupported vector store: {vector_store}") 
\ No newline at end of file
+            raise ValueError(f"Unsupported vector store: {vector_store}")
+
+    @classmethod
+    def get_client(cls, vector_store: Literal["chroma", "milvus", "local"]) -> Optional[Union["ChromaClient", "MilvusClient", "LocalClient"]]:
+        client = cls._clients.get(vector_store)
+        if client is not None:
+            return client
+
+        with cls._lock:
+            client = cls._clients.get(vector_store)
+            if client is None:
+                client = cls._create_client(vector_store)
+                if client is not None:
+                    cls._clients[vector_store] = client
+            return client
+
+    @classmethod
+    def check_health(cls) -> Dict[str, bool]:
+        status = {}
+        for vector_store, client in list(cls._clients.items()):
+            try:
+                client.ping()
+                status[vector_store] = True
+            except Exception as e:
+                print(f"Health check failed for {vector_store}: {str(e)}. Reconnecting...")
+                try:
+                    client.reconnect()
+                    client.ping()
+                    status[vector_store] = True
+                except Exception as e:
+                    print(f"Reconnect failed for {vector_store}: {str(e)}")
+                    status[vector_store] = False
+        return status
+
+    @classmethod
+    def start_health_monitor(cls, interval: float = None):
+        interval = interval or float(os.getenv("VECTOR_STORE_HEALTH_INTERVAL", 30))
+        if cls._monitor is not None and cls._monitor.is_alive():
+            return
+
+        cls._stop_event.clear()
+
+        def run():
+            while not cls._stop_event.wait(interval):
+                cls.check_health()
+
+        cls._monitor = threading.Thread(target=run, name="vector-store-health", daemon=True)
+        cls._monitor.start()
+
+    @classmethod
+    def close_all(cls):
+        cls._stop_event.set()
+        if cls._monitor is not None:
+            cls._monitor.join()
+            cls._monitor = None
+
+        with cls._lock:
+            for vector_store, client in cls._clients.items():
+                try:
+                    client.close()
+                except Exception as e:
+                    print(f"Error closing {vector_store} client: {str(e)}")
+            cls._clients.clear()
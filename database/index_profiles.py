@@ -0,0 +1,53 @@
+import os
+import json
+import math
+from typing import Any, Dict, Optional
+
+PROFILES = {
+    "FLAT": {},
+    "IVF_FLAT": {"nlist": "auto"},
+    "IVF_SQ8": {"nlist": "auto"},
+    "HNSW": {"M": 16, "efConstruction": 200}
+}
+
+def default_profile() -> str:
+    return os.getenv("MILVUS_INDEX_PROFILE", "IVF_SQ8").upper()
+
+def default_recall() -> float:
+    return float(os.getenv("MILVUS_SEARCH_RECALL", 0.5))
+
+def auto_nlist(rows: int) -> int:
+    target = 4 * math.sqrt(max(rows, 1))
+    nlist = 2 ** round(math.log2(target))
+    return int(min(max(nlist, 64), 65536))
+
+def build_index_params(profile: Optional[str] = None, rows: int = 0, metric_type: str = "L2",
+                       overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    index_type = (profile or default_profile()).upper()
+    if index_type not in PROFILES:
+        raise ValueError(f"Unknown index profile {index_type}; expected one of {', '.join(PROFILES)}")
+
+    params = dict(PROFILES[index_type])
+    params.update(overrides or {})
+    if params.get("nlist") == "auto":
+        params["nlist"] = auto_nlist(rows)
+    return {"metric_type": metric_type, "index_type": index_type, "params": params}
+
+def build_search_params(index_params: Optional[Dict[str, Any]], limit: int,
+                        recall: Optional[float] = None) -> Dict[str, Any]:
+    recall = min(max(default_recall() if recall is None else recall, 0.0), 1.0)
+    index_params = index_params or {}
+    metric_type = index_params.get("metric_type", "L2")
+    index_type = index_params.get("index_type", "IVF_SQ8")
+    params = index_params.get("params", {})
+    if isinstance(params, str):
+        params = json.loads(params)
+
+    if index_type.startswith("IVF"):
+        nlist = int(params.get("nlist", 1024))
+        nprobe = max(1, round(nlist ** (0.25 + 0.5 * recall)))
+        return {"metric_type": metric_type, "params": {"nprobe": min(nprobe, nlist)}}
+    if index_type == "HNSW":
+        ef = max(limit, round(16 + 496 * recall))
+        return {"metric_type": metric_type, "params": {"ef": ef}}
+    return {"metric_type": metric_type, "params": {}}
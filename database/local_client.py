@@ -0,0 +1,536 @@
+import os
+import json
+import shutil
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+import numpy as np
+from utils import generate_embeddings, rerank_results, get_result_cache
+from services.metrics import timed
+from .upsert import UpsertPlan, content_hash
+from .index_profiles import build_search_params
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+def _compare(value, condition) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for op, operand in condition.items():
+        if op == "$eq" and not value == operand:
+            return False
+        elif op == "$ne" and not value != operand:
+            return False
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > operand:
+                return False
+            if op == "$gte" and not value >= operand:
+                return False
+            if op == "$lt" and not value < operand:
+                return False
+            if op == "$lte" and not value <= operand:
+                return False
+        elif op == "$in" and value not in operand:
+            return False
+        elif op == "$nin" and value in operand:
+            return False
+    return True
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Dict[str, Any]) -> bool:
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif not _compare(metadata.get(key), condition):
+            return False
+    return True
+
+def matches_where_document(document: str, where_document: Dict[str, Any]) -> bool:
+    document = document or ""
+    for key, condition in where_document.items():
+        if key == "$contains" and condition not in document:
+            return False
+        elif key == "$not_contains" and condition in document:
+            return False
+        elif key == "$and" and not all(matches_where_document(document, clause) for clause in condition):
+            return False
+        elif key == "$or" and not any(matches_where_document(document, clause) for clause in condition):
+            return False
+    return True
+
+class LocalCollection:
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(path, "meta.json")
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._records_path = os.path.join(path, "records.jsonl")
+        self._hnsw_path = os.path.join(path, "hnsw.bin")
+        self._hnsw_threshold = int(os.getenv("LOCAL_HNSW_THRESHOLD", 50000))
+        self._hnsw_ef = int(os.getenv("LOCAL_HNSW_EF", 64))
+        self.dim = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self._id_index: Dict[str, int] = {}
+        self._vectors = None
+        self._mapped_rows = 0
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._hnsw = None
+        self._load()
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.dim = json.load(f).get("dim")
+
+        if os.path.exists(self._records_path):
+            with open(self._records_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    row = record.get("row")
+                    if row is not None and row < len(self.ids):
+                        self.documents[row] = record["document"]
+                        self.metadatas[row] = record["metadata"]
+                        continue
+                    self._id_index[record["id"]] = len(self.ids)
+                    self.ids.append(record["id"])
+                    self.documents.append(record["document"])
+                    self.metadatas.append(record["metadata"])
+
+        if self.dim is not None:
+            row_bytes = self.dim * 4
+            rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+            if rows != len(self.ids):
+                rows = min(rows, len(self.ids))
+                self._truncate(rows)
+            if rows:
+                self._remap()
+                self._sq_norms = np.einsum("ij,ij->i", self._vectors, self._vectors)
+
+    def _truncate(self, rows: int):
+        if os.path.exists(self._vectors_path):
+            os.truncate(self._vectors_path, rows * self.dim * 4)
+        if os.path.exists(self._hnsw_path):
+            os.remove(self._hnsw_path)
+        with open(self._records_path, "w") as f:
+            for i in range(rows):
+                f.write(json.dumps({"id": self.ids[i], "document": self.documents[i], "metadata": self.metadatas[i]}) + "\n")
+        self.ids = self.ids[:rows]
+        self.documents = self.documents[:rows]
+        self.metadatas = self.metadatas[:rows]
+        self._id_index = {id_: i for i, id_ in enumerate(self.ids)}
+
+    def _remap(self):
+        rows = len(self.ids)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+        self._mapped_rows = rows
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get_hashes(self, ids: List[str]) -> Dict[str, str]:
+        with self._lock:
+            return {
+                id_: content_hash(self.documents[self._id_index[id_]], self.metadatas[self._id_index[id_]])
+                for id_ in ids if id_ in self._id_index
+            }
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding per document")
+        metadatas = metadatas or [None] * len(ids)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+
+            latest = {}
+            for i, id_ in enumerate(ids):
+                latest[id_] = i
+            replace = [i for id_, i in latest.items() if id_ in self._id_index]
+            append = [i for id_, i in latest.items() if id_ not in self._id_index]
+
+            if replace:
+                rows = [self._id_index[ids[i]] for i in replace]
+                with open(self._vectors_path, "r+b") as f:
+                    for row, i in zip(rows, replace):
+                        f.seek(row * self.dim * 4)
+                        f.write(vectors[i].tobytes())
+                with open(self._records_path, "a") as f:
+                    for row, i in zip(rows, replace):
+                        f.write(json.dumps({"id": ids[i], "document": documents[i], "metadata": metadatas[i], "row": row}) + "\n")
+                for row, i in zip(rows, replace):
+                    self.documents[row] = documents[i]
+                    self.metadatas[row] = metadatas[i]
+                    self._sq_norms[row] = float(vectors[i] @ vectors[i])
+                if os.path.exists(self._hnsw_path):
+                    os.remove(self._hnsw_path)
+                if self._hnsw is not None:
+                    self._hnsw.add_items(vectors[replace], np.asarray(rows))
+
+            if not append:
+                return
+
+            new_vectors = vectors[append]
+            start = len(self.ids)
+            with open(self._vectors_path, "ab") as f:
+                f.write(new_vectors.tobytes())
+            with open(self._records_path, "a") as f:
+                for i in append:
+                    f.write(json.dumps({"id": ids[i], "document": documents[i], "metadata": metadatas[i]}) + "\n")
+
+            for offset, i in enumerate(append):
+                self._id_index[ids[i]] = start + offset
+                self.ids.append(ids[i])
+                self.documents.append(documents[i])
+                self.metadatas.append(metadatas[i])
+
+            self._sq_norms = np.concatenate([self._sq_norms, np.einsum("ij,ij->i", new_vectors, new_vectors)])
+            if self._hnsw is not None:
+                self._hnsw.resize_index(len(self.ids))
+                self._hnsw.add_items(new_vectors, np.arange(start, start + len(append)))
+
+    def delete_where(self, where: Dict[str, Any]) -> int:
+        # Rows are addressed by position, so deleting compacts the vector and record files around the survivors.
+        with self._lock:
+            keep = [i for i in range(len(self.ids)) if not matches_where(self.metadatas[i], where)]
+            if len(keep) == len(self.ids):
+                return 0
+            deleted = len(self.ids) - len(keep)
+            vectors = np.array(self._get_vectors()[keep]) if keep else np.zeros((0, self.dim), dtype=np.float32)
+            self._vectors = None
+            self.ids = [self.ids[i] for i in keep]
+            self.documents = [self.documents[i] for i in keep]
+            self.metadatas = [self.metadatas[i] for i in keep]
+            self._id_index = {id_: i for i, id_ in enumerate(self.ids)}
+            self._sq_norms = self._sq_norms[keep]
+
+            with open(self._vectors_path + ".tmp", "wb") as f:
+                f.write(vectors.tobytes())
+            with open(self._records_path + ".tmp", "w") as f:
+                for id_, document, metadata in zip(self.ids, self.documents, self.metadatas):
+                    f.write(json.dumps({"id": id_, "document": document, "metadata": metadata}) + "\n")
+            os.replace(self._vectors_path + ".tmp", self._vectors_path)
+            os.replace(self._records_path + ".tmp", self._records_path)
+            if os.path.exists(self._hnsw_path):
+                os.remove(self._hnsw_path)
+            self._hnsw = None
+            self._remap()
+            return deleted
+
+    def _get_vectors(self):
+        if self._mapped_rows != len(self.ids):
+            self._remap()
+        return self._vectors
+
+    def _get_hnsw(self):
+        if hnswlib is None or len(self.ids) < self._hnsw_threshold:
+            return None
+        if self._hnsw is None:
+            index = hnswlib.Index(space="l2", dim=self.dim)
+            if os.path.exists(self._hnsw_path):
+                index.load_index(self._hnsw_path, max_elements=len(self.ids))
+                if index.get_current_count() != len(self.ids):
+                    index = None
+            else:
+                index = None
+
+            if index is None:
+                index = hnswlib.Index(space="l2", dim=self.dim)
+                index.init_index(max_elements=len(self.ids), ef_construction=200, M=16)
+                index.add_items(self._get_vectors(), np.arange(len(self.ids)))
+            index.set_ef(self._hnsw_ef)
+            self._hnsw = index
+        return self._hnsw
+
+    def _exact_search(self, queries: np.ndarray, n_results: int, candidates: Optional[np.ndarray] = None):
+        vectors = self._get_vectors()
+        sq_norms = self._sq_norms
+        if candidates is not None:
+            vectors = vectors[candidates]
+            sq_norms = sq_norms[candidates]
+
+        k = min(n_results, len(sq_norms))
+        if k == 0:
+            return [[] for _ in queries], [[] for _ in queries]
+
+        distances = sq_norms[None, :] - 2.0 * (queries @ vectors.T) + np.einsum("ij,ij->i", queries, queries)[:, None]
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.maximum(np.take_along_axis(top_distances, order, axis=1), 0.0)
+
+        if candidates is not None:
+            top = candidates[top]
+        return top.tolist(), top_distances.tolist()
+
+    def search(self, query_embeddings: List[List[float]], n_results: int,
+               where: Optional[Dict[str, Any]] = None,
+               where_document: Optional[Dict[str, Any]] = None,
+               ef: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        with self._lock:
+            # Hits are resolved to ids and payloads before the lock is released, since a delete compacts the rows.
+            indices, distances = self._search_rows(query_embeddings, n_results, where, where_document, ef)
+            return [[{
+                "id": self.ids[i],
+                "text": self.documents[i],
+                "metadata": self.metadatas[i] or {},
+                "score": distance
+            } for i, distance in zip(row_indices, row_distances)] for row_indices, row_distances in zip(indices, distances)]
+
+    def _search_rows(self, query_embeddings: List[List[float]], n_results: int,
+                     where: Optional[Dict[str, Any]] = None,
+                     where_document: Optional[Dict[str, Any]] = None,
+                     ef: Optional[int] = None):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        with self._lock:
+            if not self.ids:
+                return [[] for _ in queries], [[] for _ in queries]
+
+            if where or where_document:
+                candidates = np.array([
+                    i for i in range(len(self.ids))
+                    if (not where or matches_where(self.metadatas[i], where))
+                    and (not where_document or matches_where_document(self.documents[i], where_document))
+                ], dtype=np.int64)
+                return self._exact_search(queries, n_results, candidates)
+
+            index = self._get_hnsw()
+            if index is not None:
+                k = min(n_results, len(self.ids))
+                if ef is not None:
+                    index.set_ef(max(ef, k))
+                try:
+                    labels, distances = index.knn_query(queries, k=k)
+                finally:
+                    if ef is not None:
+                        index.set_ef(self._hnsw_ef)
+                return labels.tolist(), distances.tolist()
+
+            return self._exact_search(queries, n_results)
+
+    def flush(self):
+        with self._lock:
+            for path in (self._vectors_path, self._records_path):
+                if os.path.exists(path):
+                    fd = os.open(path, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+
+    def peek(self, limit: int = 10):
+        with self._lock:
+            rows = min(limit, len(self.ids))
+            vectors = self._get_vectors()
+            return {
+                "ids": self.ids[:rows],
+                "embeddings": vectors[:rows].tolist() if rows else [],
+                "metadatas": self.metadatas[:rows],
+                "documents": self.documents[:rows]
+            }
+
+    def export(self, offset: int, limit: int, include_embeddings: bool = False):
+        with self._lock:
+            end = min(offset + limit, len(self.ids))
+            vectors = np.array(self._get_vectors()[offset:end]) if include_embeddings and end > offset else None
+            return self.ids[offset:end], self.documents[offset:end], self.metadatas[offset:end], vectors
+
+    def close(self):
+        with self._lock:
+            if self._hnsw is not None:
+                self._hnsw.save_index(self._hnsw_path)
+                self._hnsw = None
+            self._vectors = None
+            self._mapped_rows = 0
+
+class LocalClient:
+    vector_store = "local"
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("LOCAL_STORE_PATH", os.path.join(os.getenv("CHROMA_PATH", "/app/data"), "local"))
+        os.makedirs(self.path, exist_ok=True)
+        self._collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.RLock()
+        self._rerank_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RERANK_MAX_CONCURRENCY", 8)),
+            thread_name_prefix="local-rerank"
+        )
+
+    def ping(self):
+        if not os.path.isdir(self.path):
+            raise RuntimeError(f"Local store path {self.path} is not available")
+
+    def reconnect(self):
+        self.close()
+        os.makedirs(self.path, exist_ok=True)
+
+    def close(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections.clear()
+
+    def _collection_path(self, name: str) -> str:
+        if not name or "/" in name or name.startswith("."):
+            raise ValueError(f"Invalid collection name: {name}")
+        return os.path.join(self.path, name)
+
+    def list_collections(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, name)))
+
+    def create_collection(self, name: str):
+        path = self._collection_path(name)
+        with self._lock:
+            if os.path.exists(path):
+                raise ValueError(f"Collection {name} already exists")
+            collection = LocalCollection(name, path)
+            self._collections[name] = collection
+            return collection
+
+    def get_collection(self, name: str) -> LocalCollection:
+        collection = self._collections.get(name)
+        if collection is not None:
+            return collection
+
+        path = self._collection_path(name)
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                if not os.path.isdir(path):
+                    raise ValueError(f"Collection {name} does not exist")
+                collection = LocalCollection(name, path)
+                self._collections[name] = collection
+            return collection
+
+    def delete_collection(self, name: str):
+        path = self._collection_path(name)
+        with self._lock:
+            if not os.path.isdir(path):
+                raise ValueError(f"Collection {name} does not exist")
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection.close()
+            shutil.rmtree(path)
+        get_result_cache().bump(self.vector_store, name)
+
+    def plan_documents(self, collection_name: str, documents: List[str],
+                       metadatas: Optional[List[Dict[str, Any]]] = None,
+                       ids: Optional[List[str]] = None) -> UpsertPlan:
+        collection = self.get_collection(collection_name)
+        plan = UpsertPlan(collection_name, documents, metadatas, ids)
+        hashes = collection.get_hashes(plan.candidate_ids)
+        return plan.resolve({id_: True for id_ in hashes}, hashes)
+
+    def write_documents(self, plan: UpsertPlan, embeddings: Optional[List[List[float]]] = None,
+                        flush: bool = True) -> Dict[str, int]:
+        if not plan.ids:
+            return plan.summary()
+
+        collection = self.get_collection(plan.collection_name)
+        if embeddings is None:
+            embeddings = generate_embeddings(plan.documents)
+
+        collection.upsert(ids=plan.ids, embeddings=embeddings, documents=plan.documents, metadatas=plan.metadatas)
+        stale = plan.stale_chunk_filter()
+        if stale:
+            collection.delete_where(stale)
+        get_result_cache().bump(self.vector_store, plan.collection_name)
+        if flush:
+            collection.flush()
+        return plan.summary()
+
+    def add_documents(self, collection_name: str, documents: List[str],
+                     metadatas: Optional[List[Dict[str, Any]]] = None,
+                     ids: Optional[List[str]] = None,
+                     embeddings: Optional[List[List[float]]] = None,
+                     flush: bool = True):
+        plan = self.plan_documents(collection_name, documents, metadatas, ids)
+        return self.write_documents(plan, plan.select_embeddings(embeddings), flush=flush)
+
+    def flush(self, collection_name: str):
+        self.get_collection(collection_name).flush()
+
+    def query(self, collection_name: str, query_texts: List[str],
+              n_results: int = 10, where: Optional[Dict[str, Any]] = None,
+              where_document: Optional[Dict[str, Any]] = None,
+              rerank: bool = False,
+              query_embeddings: Optional[List[List[float]]] = None,
+              rerank_top_m: Optional[int] = None,
+              recall: Optional[float] = None):
+        collection = self.get_collection(collection_name)
+
+        if query_embeddings is None:
+            query_embeddings = generate_embeddings(query_texts)
+
+        with timed("search"):
+            ef = build_search_params({"index_type": "HNSW"}, n_results, recall)["params"]["ef"] if recall is not None else None
+            grouped_results = collection.search(query_embeddings, n_results, where=where, where_document=where_document, ef=ef)
+
+        if rerank:
+            futures = [
+                self._rerank_executor.submit(contextvars.copy_context().run, rerank_results, query, hits, top_m=rerank_top_m) if hits else None
+                for query, hits in zip(query_texts, grouped_results)
+            ]
+            grouped_results = [
+                future.result() if future is not None else hits
+                for future, hits in zip(futures, grouped_results)
+            ]
+
+        results = {
+            "ids": [[item["id"] for item in hits] for hits in grouped_results],
+            "distances": [[item["score"] for item in hits] for hits in grouped_results],
+            "metadatas": [[item["metadata"] for item in hits] for hits in grouped_results],
+            "documents": [[item["text"] for item in hits] for hits in grouped_results],
+            "embeddings": None
+        }
+        if rerank:
+            results["reranked"] = True
+        return results
+
+    def export_pages(self, collection_name: str, cursor: Optional[str] = None, batch_size: int = 1000,
+                     include_embeddings: bool = False) -> Iterator[Tuple[List[Dict[str, Any]], str]]:
+        collection = self.get_collection(collection_name)
+        offset = int(cursor or 0)
+        while True:
+            ids, documents, metadatas, vectors = collection.export(offset, batch_size, include_embeddings)
+            if not ids:
+                return
+            offset += len(ids)
+            yield [{
+                "id": ids[i],
+                "document": documents[i],
+                "metadata": metadatas[i],
+                **({"embedding": vectors[i]} if include_embeddings else {})
+            } for i in range(len(ids))], str(offset)
+            if len(ids) < batch_size:
+                return
+
+    def distance_metric(self, collection_name: str) -> str:
+        self.get_collection(collection_name)
+        return "l2"
+
+    def peek(self, collection_name: str, limit: int = 10):
+        return self.get_collection(collection_name).peek(limit=limit)
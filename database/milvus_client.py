@@ -1,23 +1,41 @@
 from pymilvus import connections, Collection, utility, DataType, CollectionSchema, FieldSchema
-from typing import List, Dict, Any, Optional
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 import numpy as np
-from utils import generate_embedding, rerank_results
-import time
+from utils import generate_embedding, generate_embeddings, rerank_results, get_result_cache, get_embedding_dimension
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from .residency import ResidencyManager
+import contextvars
+from services.metrics import timed, count_cache
+from .upsert import UpsertPlan
+from .milvus_filters import build_expr
+from .index_profiles import build_index_params, build_search_params
+import time
+import json
 
 class MilvusClient:
+    vector_store = "milvus"
+
     def __init__(self, uri: str, token: str):
         self.uri = uri
         self.token = token
         self.connect()
-        self._loaded_collections = {}
-        self._embedding_cache = {}
-        self._rerank_cache = {}
-        self._default_search_params = {
-            "metric_type": "L2",
-            "params": {"nprobe": 10}
-        }
+        self._lock = threading.RLock()
+        self._residency = ResidencyManager()
+        self._collection_cache = {}
+        self._write_locks = {}
+        self._expected_rows = int(os.getenv("MILVUS_EXPECTED_ROWS", 100000))
         self._batch_size = 100
+        self._lookup_batch_size = 1000
+        self._partition_keys = self._parse_partition_keys(os.getenv("MILVUS_PARTITION_KEYS", ""))
+        self._num_partitions = int(os.getenv("MILVUS_NUM_PARTITIONS", 64))
+        self._rerank_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RERANK_MAX_CONCURRENCY", 8)),
+            thread_name_prefix="milvus-rerank"
+        )
+        self._residency.start()
 
     def connect(self):
         connections.connect(
@@ -29,33 +47,119 @@ class MilvusClient:
     def disconnect(self):
         connections.disconnect("default")
 
+    def ping(self):
+        utility.get_server_version()
+
+    def reconnect(self):
+        with self._lock:
+            try:
+                self.disconnect()
+            except Exception:
+                pass
+            self.connect()
+            self._collection_cache.clear()
+            self._residency.reset()
+
+    def close(self):
+        self._residency.stop()
+        self._rerank_executor.shutdown(wait=True)
+        with self._lock:
+            self.disconnect()
+            self._collection_cache.clear()
+            self._residency.reset()
+
+    @staticmethod
+    def _parse_partition_keys(value: str) -> Dict[str, str]:
+        partition_keys = {}
+        for entry in value.split(","):
+            if ":" in entry:
+                collection_name, key = entry.split(":", 1)
+                partition_keys[collection_name.strip()] = key.strip()
+        return partition_keys
+
     def list_collections(self) -> List[str]:
         return utility.list_collections()
 
-    def create_collection(self, name: str, dim: int = 1024):
+    def _remember_collection(self, collection: Collection, validated: bool = False) -> Collection:
+        dim = None
+        for field in collection.schema.fields:
+            if field.name == "embedding":
+                dim = field.params.get("dim")
+        index_params = None
+        for index in collection.indexes:
+            if index.field_name == "embedding":
+                index_params = index.params
+        partition_key = None
+        for field in collection.schema.fields:
+            if field.name == "partition_key":
+                partition_key = field.description
+        with self._lock:
+            self._collection_cache[collection.name] = {
+                "collection": collection,
+                "dim": dim,
+                "index_params": index_params,
+                "fields": [field.name for field in collection.schema.fields],
+                "partition_key": partition_key,
+                "validated": validated
+            }
+        return collection
+
+    def _invalidate_collection(self, name: str):
+        with self._lock:
+            self._collection_cache.pop(name, None)
+        self._residency.forget(name)
+        get_result_cache().bump(self.vector_store, name)
+
+    def collection_info(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._collection_cache.get(name)
+
+    def create_collection(self, name: str, dim: Optional[int] = None, partition_key: Optional[str] = None,
+                          index_profile: Optional[str] = None, index_params: Optional[Dict[str, Any]] = None,
+                          expected_rows: Optional[int] = None):
         if utility.has_collection(name):
-            return Collection(name)
+            return self._remember_collection(Collection(name))
+        dim = dim or get_embedding_dimension()
+        partition_key = partition_key or self._partition_keys.get(name)
+        index_params = build_index_params(index_profile, expected_rows or self._expected_rows, overrides=index_params)
         
         fields = [
             FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
             FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dim),
             FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-            FieldSchema(name="metadata", dtype=DataType.JSON)
+            FieldSchema(name="metadata", dtype=DataType.JSON),
+            FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=512),
+            FieldSchema(name="content_hash", dtype=DataType.VARCHAR, max_length=64)
         ]
+        if partition_key:
+            fields.append(FieldSchema(
+                name="partition_key", dtype=DataType.VARCHAR, max_length=256,
+                is_partition_key=True, description=partition_key
+            ))
         
         schema = CollectionSchema(fields=fields, description=f"Collection for {name}")
         
-        collection = Collection(name=name, schema=schema)
+        if partition_key:
+            collection = Collection(name=name, schema=schema, num_partitions=self._num_partitions)
+        else:
+            collection = Collection(name=name, schema=schema)
         
-        index_params = {
-            "metric_type": "L2",
-            "index_type": "IVF_SQ8",
-            "params": {"nlist": 1024}
-        }
-        collection.create_index(field_name="embedding", index_params=index_params)
-        return collection
+        collection.create_index(field_name="embedding", index_params=index_params, index_name="embedding_index")
+        collection.create_index(field_name="doc_id", index_name="doc_id_index")
+        if partition_key:
+            collection.create_index(field_name="partition_key", index_name="partition_key_index")
+        return self._remember_collection(collection, validated=True)
     
-    def ensure_collection(self, name: str, dim: int = 768):
+    def ensure_collection(self, name: str, dim: Optional[int] = None):
+        cached = self._collection_cache.get(name)
+        if cached is not None and cached["validated"]:
+            count_cache("milvus_collection", True)
+            return cached["collection"]
+
+        count_cache("milvus_collection", False)
+        with timed("ensure_collection"):
+            return self._ensure_collection(name, dim)
+
+    def _ensure_collection(self, name: str, dim: Optional[int]):
         try:
             if utility.has_collection(name):
                 collection = Collection(name)
@@ -76,9 +180,10 @@ class MilvusClient:
                 if not (has_embedding and has_text and has_metadata):
                     print(f"Collection {name} exists but doesn't have the required fields. Recreating...")
                     utility.drop_collection(name)
+                    self._invalidate_collection(name)
                     return self.create_collection(name, dim)
                 
-                return collection
+                return self._remember_collection(collection, validated=True)
             else:
                 return self.create_collection(name, dim)
         except Exception as e:
@@ -88,128 +193,322 @@ class MilvusClient:
                     utility.drop_collection(name)
             except:
                 pass
+            self._invalidate_collection(name)
             return self.create_collection(name, dim)
 
     def get_collection(self, name: str) -> Collection:
+        cached = self._collection_cache.get(name)
+        if cached is not None:
+            return cached["collection"]
+
         if not utility.has_collection(name):
             raise ValueError(f"Collection {name} does not exist")
-        return Collection(name)
+        return self._remember_collection(Collection(name))
 
     def delete_collection(self, name: str):
+        self._invalidate_collection(name)
         if utility.has_collection(name):
             utility.drop_collection(name)
-            if name in self._loaded_collections:
-                del self._loaded_collections[name]
 
-    def _get_cached_embedding(self, text: str) -> np.ndarray:
-        if text in self._embedding_cache:
-            return self._embedding_cache[text]
-        
-        embedding = generate_embedding(text)
-        self._embedding_cache[text] = embedding
-        return embedding
-
-    def _get_cached_rerank(self, query: str, texts:Dict) -> List[int]:
-        # print(1.1)
-        cache_key = f"{query}:{str(texts)}"
-        # print(1.2)
-        if cache_key in self._rerank_cache:
-            return self._rerank_cache[cache_key]
-        # print(1.3)
-        # print(query)
-        # print(texts)
-        reraked_documents = rerank_results(query, texts)
-        # print(reraked_documents)
-        self._rerank_cache[cache_key] = str(reraked_documents)
-        return reraked_documents
+    def _get_cached_embedding(self, text: str) -> List[float]:
+        return generate_embedding(text)
+
+    def _get_cached_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return generate_embeddings(texts)
 
     def _load_collection(self, collection: Collection):
-        collection_name = collection.name
-        if collection_name not in self._loaded_collections:
-            collection.load()
-            self._loaded_collections[collection_name] = time.time()
-            print(f"Loaded collection {collection_name}")
-
-    def _release_collection(self, collection: Collection):
-        collection_name = collection.name
-        if collection_name in self._loaded_collections:
-            if time.time() - self._loaded_collections[collection_name] > 300:
-                collection.release()
-                del self._loaded_collections[collection_name]
-                print(f"Released collection {collection_name}")
+        self._residency.acquire(collection)
+
+    def rebuild_index(self, name: str, index_profile: Optional[str] = None,
+                      index_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        collection = self.get_collection(name)
+        current = None
+        for index in collection.indexes:
+            if index.field_name == "embedding":
+                current = index
+        current_params = current.params if current is not None else {}
+        rows = collection.num_entities
+        params = build_index_params(
+            index_profile or current_params.get("index_type"),
+            rows,
+            metric_type=current_params.get("metric_type", "L2"),
+            overrides=index_params
+        )
+
+        start = time.perf_counter()
+        with timed("index_rebuild"), self._residency.exclusive(name):
+            collection.release()
+            if current is not None:
+                collection.drop_index(index_name=current.index_name)
+            index_name = current.index_name if current is not None else "embedding_index"
+            collection.create_index(field_name="embedding", index_params=params, index_name=index_name)
+            utility.wait_for_index_building_complete(name, index_name=index_name)
+            self._remember_collection(collection, validated=True)
+            get_result_cache().bump(self.vector_store, name)
+        self._load_collection(collection)
+
+        return {
+            "collection": name,
+            "rows": rows,
+            "index": params,
+            "elapsed_seconds": time.perf_counter() - start
+        }
+
+    def residency_stats(self):
+        return self._residency.stats()
+
+    def _has_field(self, collection_name: str, field: str) -> bool:
+        cached = self._collection_cache.get(collection_name)
+        return cached is not None and field in cached["fields"]
+
+    def _partition_key(self, collection_name: str) -> Optional[str]:
+        cached = self._collection_cache.get(collection_name)
+        return cached["partition_key"] if cached is not None else None
+
+    def plan_documents(self, collection_name: str, documents: List[str],
+                       metadatas: Optional[List[Dict[str, Any]]] = None,
+                       ids: Optional[List[str]] = None) -> UpsertPlan:
+        collection = self.ensure_collection(collection_name)
+        plan = UpsertPlan(collection_name, documents, metadatas, ids)
+        if not self._has_field(collection_name, "doc_id"):
+            return plan.resolve({}, {})
+
+        existing = {}
+        existing_hashes = {}
+        candidate_ids = plan.candidate_ids
+        if candidate_ids and collection.num_entities:
+            self._load_collection(collection)
+            with timed("upsert_lookup"):
+                for i in range(0, len(candidate_ids), self._lookup_batch_size):
+                    batch_ids = candidate_ids[i:i+self._lookup_batch_size]
+                    rows = collection.query(
+                        expr=f"doc_id in {json.dumps(batch_ids)}",
+                        output_fields=["id", "doc_id", "content_hash"]
+                    )
+                    for row in rows:
+                        existing.setdefault(row["doc_id"], []).append(row["id"])
+                        existing_hashes[row["doc_id"]] = row["content_hash"]
+        return plan.resolve(existing, existing_hashes)
+
+    def write_documents(self, plan: UpsertPlan, embeddings: Optional[List[List[float]]] = None,
+                        flush: bool = True) -> Dict[str, int]:
+        if not plan.ids:
+            return plan.summary()
+
+        collection = self.ensure_collection(plan.collection_name)
+        with_ids = self._has_field(plan.collection_name, "doc_id")
+        partition_key = self._partition_key(plan.collection_name)
+
+        with self._write_lock(plan.collection_name):
+            inserted = []
+            batch_size = self._batch_size
+            for i in range(0, len(plan.documents), batch_size):
+                batch_docs = plan.documents[i:i+batch_size]
+                batch_metadatas = [metadata or {} for metadata in plan.metadatas[i:i+batch_size]]
+
+                if embeddings is None:
+                    batch_embeddings = self._get_cached_embeddings(batch_docs)
+                else:
+                    batch_embeddings = embeddings[i:i+batch_size]
+
+                data = [
+                    batch_embeddings,
+                    batch_docs,
+                    batch_metadatas
+                ]
+                if with_ids:
+                    data.extend([plan.ids[i:i+batch_size], plan.content_hashes[i:i+batch_size]])
+                if partition_key:
+                    data.append([str(metadata.get(partition_key, "")) for metadata in batch_metadatas])
+
+                inserted.extend(collection.insert(data).primary_keys)
+
+            # Old rows go only once the new ones are in, so a failed insert never loses a document. Every row
+            # of a written doc_id other than the ones just inserted is removed, which also drops duplicates
+            # from a concurrent plan that saw the same doc_id as new.
+            if with_ids:
+                self._delete_superseded(collection, plan.ids, set(inserted))
+            stale = plan.stale_chunk_filter()
+            if stale:
+                self._delete_matching(collection, build_expr(stale, partition_key=partition_key))
+
+        get_result_cache().bump(self.vector_store, plan.collection_name)
+        if flush:
+            collection.flush()
+        return plan.summary()
+
+    def _write_lock(self, collection_name: str) -> threading.Lock:
+        with self._lock:
+            return self._write_locks.setdefault(collection_name, threading.Lock())
+
+    def _delete_matching(self, collection: Collection, expr: str, keep: set = frozenset()):
+        self._load_collection(collection)
+        rows = collection.query(expr=expr, output_fields=["id"], consistency_level="Strong")
+        stale = [row["id"] for row in rows if row["id"] not in keep]
+        for i in range(0, len(stale), self._lookup_batch_size):
+            collection.delete(expr=f"id in {stale[i:i+self._lookup_batch_size]}")
+
+    def _delete_superseded(self, collection: Collection, doc_ids: List[str], keep: set):
+        doc_ids = list(dict.fromkeys(doc_ids))
+        for i in range(0, len(doc_ids), self._lookup_batch_size):
+            self._delete_matching(collection, f"doc_id in {json.dumps(doc_ids[i:i+self._lookup_batch_size])}", keep)
 
     def add_documents(self, collection_name: str, documents: List[str], 
                      metadatas: Optional[List[Dict[str, Any]]] = None,
-                     ids: Optional[List[str]] = None):
+                     ids: Optional[List[str]] = None,
+                     embeddings: Optional[List[List[float]]] = None,
+                     flush: bool = True):
+        plan = self.plan_documents(collection_name, documents, metadatas, ids)
+        return self.write_documents(plan, plan.select_embeddings(embeddings), flush=flush)
+
+    def flush(self, collection_name: str):
+        self.ensure_collection(collection_name).flush()
+
+    def _format_query_results(self, grouped_results: List[List[Dict[str, Any]]], reranked: bool = False):
+        results = {
+            "ids": [[item["id"] for item in hits] for hits in grouped_results],
+            "distances": [[item["score"] for item in hits] for hits in grouped_results],
+            "metadatas": [[item["metadata"] for item in hits] for hits in grouped_results],
+            "documents": [[item["text"] for item in hits] for hits in grouped_results],
+            "embeddings": None
+        }
+        if reranked:
+            results["reranked"] = True
+        return results
+
+    def _search(self, collection_name: str, was_cached: bool, **search_args):
         collection = self.ensure_collection(collection_name)
-        
-        batch_size = self._batch_size
-        for i in range(0, len(documents), batch_size):
-            batch_docs = documents[i:i+batch_size]
-            batch_metadatas = (metadatas or [{}] * len(documents))[i:i+batch_size]
-            
-            embeddings = [self._get_cached_embedding(doc) for doc in batch_docs]
-            
-            data = [
-                embeddings,
-                batch_docs,  
-                batch_metadatas  
-            ]
-            
-            collection.insert(data)
-        
-        collection.flush()
-        
-        self._release_collection(collection)
+        self._load_collection(collection)
+        try:
+            with timed("search"):
+                return collection.search(**search_args)
+        except Exception as e:
+            if not was_cached:
+                raise
+            print(f"Search on cached collection {collection_name} failed: {str(e)}. Refreshing metadata...")
+            self._invalidate_collection(collection_name)
+            collection = self.ensure_collection(collection_name)
+            self._load_collection(collection)
+            with timed("search"):
+                return collection.search(**search_args)
 
     def query(self, collection_name: str, query_texts: List[str], 
               n_results: int = 10, where: Optional[Dict[str, Any]] = None,
               where_document: Optional[Dict[str, Any]] = None,
-              rerank: bool = False):
+              rerank: bool = False,
+              query_embeddings: Optional[List[List[float]]] = None,
+              rerank_top_m: Optional[int] = None,
+              recall: Optional[float] = None):
         try:
-            collection = self.ensure_collection(collection_name)
-            
-            self._load_collection(collection)
-            
-            query_embedding = self._get_cached_embedding(query_texts[0])
+            if query_embeddings is None:
+                query_embeddings = self._get_cached_embeddings(query_texts)
             
-            results = collection.search(
-                data=[query_embedding],
+            # Only metadata that came from the cache can be stale, so only then is a failed search retried.
+            was_cached = collection_name in self._collection_cache
+            self.ensure_collection(collection_name)
+            output_fields = ["text", "metadata"]
+            if self._has_field(collection_name, "doc_id"):
+                output_fields.append("doc_id")
+            search_args = {}
+            expr = build_expr(where, where_document, self._partition_key(collection_name))
+            if expr:
+                search_args["expr"] = expr
+            cached = self._collection_cache.get(collection_name)
+            results = self._search(
+                collection_name,
+                was_cached,
+                data=query_embeddings,
                 anns_field="embedding",
-                param=self._default_search_params,
+                param=build_search_params(cached["index_params"] if cached else None, n_results, recall),
                 limit=n_results,
-                output_fields=["text", "metadata"]
+                output_fields=output_fields,
+                **search_args
             )
             
-            formatted_results = []
+            grouped_results = []
             for hits in results:
-                for hit in hits:
-                    formatted_results.append({
-                        "id": str(hit.id),
-                        "text": hit.entity.get('text'),
-                        "metadata": hit.entity.get('metadata'),
-                        "score": hit.score
-                    })
+                grouped_results.append([{
+                    "id": hit.entity.get("doc_id") or str(hit.id),
+                    "text": hit.entity.get('text'),
+                    "metadata": hit.entity.get('metadata'),
+                    "score": hit.score
+                } for hit in hits])
             
-            if rerank and formatted_results:
-                # texts = [item["text"] for item in formatted_results]
-                
-                # reranked_indices = self._get_cached_rerank(query_texts[0], texts)
-                
-                # reranked_results = [formatted_results[i] for i in reranked_indices]
-                # print(1)
-                # print(query_texts)
-                # print(formatted_results)
-                reranked_results= self._get_cached_rerank(query=query_texts[0], texts=formatted_results)
-                # print(2)
-                for item in reranked_results:
-                    item["reranked"] = True
-                    
-                return reranked_results
+            if rerank and any(grouped_results):
+                futures = [
+                    self._rerank_executor.submit(contextvars.copy_context().run, rerank_results, query, hits, top_m=rerank_top_m) if hits else None
+                    for query, hits in zip(query_texts, grouped_results)
+                ]
+                grouped_results = [
+                    future.result() if future is not None else hits
+                    for future, hits in zip(futures, grouped_results)
+                ]
+                return self._format_query_results(grouped_results, reranked=True)
             
-            return formatted_results
+            return self._format_query_results(grouped_results)
         except Exception as e:
             print(f"Error in Milvus query: {str(e)}")
             raise
+
+    def export_pages(self, collection_name: str, cursor: Optional[str] = None, batch_size: int = 1000,
+                     include_embeddings: bool = False) -> Iterator[Tuple[List[Dict[str, Any]], str]]:
+        collection = self.get_collection(collection_name)
+        self._load_collection(collection)
+        output_fields = ["id", "text", "metadata"]
+        if self._has_field(collection_name, "doc_id"):
+            output_fields.append("doc_id")
+        if include_embeddings:
+            output_fields.append("embedding")
+        # The query iterator pages by primary key, so the last key of a page is a resumable cursor.
+        iterator = collection.query_iterator(
+            batch_size=batch_size,
+            expr=f"id > {int(cursor)}" if cursor else None,
+            output_fields=output_fields
+        )
+        try:
+            while True:
+                page = iterator.next()
+                if not page:
+                    return
+                self._load_collection(collection)
+                yield [{
+                    "id": item.get("doc_id") or str(item["id"]),
+                    "document": item["text"],
+                    "metadata": item["metadata"],
+                    **({"embedding": item["embedding"]} if include_embeddings else {})
+                } for item in page], str(page[-1]["id"])
         finally:
-            self._release_collection(collection) 
\ No newline at end of file
+            iterator.close()
+
+    def distance_metric(self, collection_name: str) -> str:
+        self.ensure_collection(collection_name)
+        cached = self._collection_cache.get(collection_name)
+        index_params = (cached["index_params"] if cached else None) or {}
+        return index_params.get("metric_type", "L2")
+
+    def peek(self, collection_name: str, limit: int = 10):
+        collection = self.get_collection(collection_name)
+        self._load_collection(collection)
+        
+        total_count = collection.num_entities
+        
+        if total_count == 0:
+            return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        
+        output_fields = ["id", "text", "metadata"]
+        if self._has_field(collection_name, "doc_id"):
+            output_fields.append("doc_id")
+        results = collection.query(
+            expr="id >= 0",
+            output_fields=output_fields,
+            limit=limit
+        )
+        
+        formatted_results = {
+            "ids": [item.get("doc_id") or str(item["id"]) for item in results],
+            "documents": [item["text"] for item in results],
+            "metadatas": [item["metadata"] for item in results],
+            "embeddings": [] 
+        }
+        
+        return formatted_results
@@ -0,0 +1,84 @@
+import json
+from typing import Any, Dict, Optional
+
+_COMPARISONS = {
+    "$eq": "==",
+    "$ne": "!=",
+    "$gt": ">",
+    "$gte": ">=",
+    "$lt": "<",
+    "$lte": "<="
+}
+
+def _literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_literal(item) for item in value) + "]"
+    return json.dumps(str(value))
+
+def _join(clauses, operator: str) -> str:
+    clauses = [clause for clause in clauses if clause]
+    if not clauses:
+        return ""
+    if len(clauses) == 1:
+        return clauses[0]
+    return "(" + f" {operator} ".join(f"({clause})" for clause in clauses) + ")"
+
+def _field_condition(key: str, condition: Any, partition_key: Optional[str]) -> str:
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+
+    clauses = []
+    for op, value in condition.items():
+        if key == partition_key and op in ("$eq", "$in"):
+            field = "partition_key"
+            value = [str(item) for item in value] if op == "$in" else str(value)
+        else:
+            field = f"metadata[{json.dumps(key)}]"
+
+        if op in _COMPARISONS:
+            clauses.append(f"{field} {_COMPARISONS[op]} {_literal(value)}")
+        elif op == "$in":
+            clauses.append(f"{field} in {_literal(value)}")
+        elif op == "$nin":
+            clauses.append(f"{field} not in {_literal(value)}")
+        else:
+            raise ValueError(f"Unsupported where operator {op} for field {key}")
+    return _join(clauses, "and")
+
+def where_to_expr(where: Optional[Dict[str, Any]], partition_key: Optional[str] = None) -> str:
+    if not where:
+        return ""
+    clauses = []
+    for key, condition in where.items():
+        if key == "$and":
+            clauses.append(_join([where_to_expr(clause, partition_key) for clause in condition], "and"))
+        elif key == "$or":
+            clauses.append(_join([where_to_expr(clause, partition_key) for clause in condition], "or"))
+        else:
+            clauses.append(_field_condition(key, condition, partition_key))
+    return _join(clauses, "and")
+
+def where_document_to_expr(where_document: Optional[Dict[str, Any]]) -> str:
+    if not where_document:
+        return ""
+    clauses = []
+    for key, condition in where_document.items():
+        if key == "$contains":
+            clauses.append(f"text like {json.dumps('%' + condition + '%')}")
+        elif key == "$not_contains":
+            clauses.append(f"not (text like {json.dumps('%' + condition + '%')})")
+        elif key == "$and":
+            clauses.append(_join([where_document_to_expr(clause) for clause in condition], "and"))
+        elif key == "$or":
+            clauses.append(_join([where_document_to_expr(clause) for clause in condition], "or"))
+        else:
+            raise ValueError(f"Unsupported where_document operator {key}")
+    return _join(clauses, "and")
+
+def build_expr(where: Optional[Dict[str, Any]] = None, where_document: Optional[Dict[str, Any]] = None,
+               partition_key: Optional[str] = None) -> str:
+    return _join([where_to_expr(where, partition_key), where_document_to_expr(where_document)], "and")
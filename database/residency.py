@@ -0,0 +1,168 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Callable
+from pymilvus import Collection
+from services.metrics import timed
+
+class CollectionState:
+    def __init__(self, name: str):
+        self.name = name
+        self.loaded = False
+        self.last_access = 0.0
+        self.frequency = 0.0
+        self.estimated_bytes = 0
+        self.lock = threading.Lock()
+
+    def touch(self, half_life: float):
+        now = time.time()
+        if self.last_access:
+            self.frequency *= 0.5 ** ((now - self.last_access) / half_life)
+        self.frequency += 1.0
+        self.last_access = now
+
+class ResidencyManager:
+    def __init__(self, collection_factory: Callable[[str], Collection] = Collection,
+                 memory_budget: int = None, idle_seconds: float = None,
+                 policy: str = None, interval: float = None, preload: Optional[List[str]] = None):
+        self._collection_factory = collection_factory
+        self._memory_budget = memory_budget if memory_budget is not None else int(os.getenv("MILVUS_MEMORY_BUDGET_BYTES", 0))
+        self._idle_seconds = idle_seconds if idle_seconds is not None else float(os.getenv("MILVUS_RESIDENCY_IDLE_SECONDS", 300))
+        self._policy = (policy or os.getenv("MILVUS_EVICTION_POLICY", "lru")).lower()
+        self._interval = interval if interval is not None else float(os.getenv("MILVUS_RESIDENCY_INTERVAL", 30))
+        if preload is None:
+            preload = [name.strip() for name in os.getenv("MILVUS_PRELOAD_COLLECTIONS", "").split(",") if name.strip()]
+        self._pinned = set(preload)
+        self._states: Dict[str, CollectionState] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _state(self, name: str) -> CollectionState:
+        state = self._states.get(name)
+        if state is None:
+            with self._lock:
+                state = self._states.setdefault(name, CollectionState(name))
+        return state
+
+    def _estimate_bytes(self, collection: Collection) -> int:
+        dim = 0
+        for field in collection.schema.fields:
+            if field.name == "embedding":
+                dim = field.params.get("dim", 0)
+        return collection.num_entities * (int(dim) * 4 + 64)
+
+    def start(self):
+        for name in self._pinned:
+            try:
+                self.acquire(self._collection_factory(name))
+            except Exception as e:
+                print(f"Failed to preload collection {name}: {str(e)}")
+
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="milvus-residency", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def acquire(self, collection: Collection):
+        state = self._state(collection.name)
+        state.touch(self._idle_seconds)
+        if state.loaded:
+            return
+
+        with state.lock:
+            if not state.loaded:
+                with timed("collection_load"):
+                    collection.load()
+                state.estimated_bytes = self._estimate_bytes(collection)
+                state.loaded = True
+                print(f"Loaded collection {collection.name}")
+
+        if self._memory_budget:
+            self.enforce_budget(exclude=collection.name)
+
+    @contextmanager
+    def exclusive(self, name: str):
+        state = self._state(name)
+        with state.lock:
+            if state.loaded:
+                try:
+                    self._collection_factory(name).release()
+                finally:
+                    state.loaded = False
+            yield
+
+    def forget(self, name: str):
+        with self._lock:
+            self._states.pop(name, None)
+
+    def reset(self):
+        with self._lock:
+            self._states.clear()
+
+    def is_loaded(self, name: str) -> bool:
+        state = self._states.get(name)
+        return state is not None and state.loaded
+
+    def _release(self, state: CollectionState):
+        with state.lock:
+            if not state.loaded:
+                return
+            try:
+                self._collection_factory(state.name).release()
+            except Exception as e:
+                print(f"Failed to release collection {state.name}: {str(e)}")
+                return
+            state.loaded = False
+            print(f"Released collection {state.name}")
+
+    def _eviction_order(self) -> List[CollectionState]:
+        candidates = [state for state in self._states.values() if state.loaded and state.name not in self._pinned]
+        if self._policy == "lfu":
+            now = time.time()
+            return sorted(candidates, key=lambda s: s.frequency * 0.5 ** ((now - s.last_access) / self._idle_seconds))
+        return sorted(candidates, key=lambda s: s.last_access)
+
+    def enforce_budget(self, exclude: Optional[str] = None):
+        used = sum(state.estimated_bytes for state in self._states.values() if state.loaded)
+        for state in self._eviction_order():
+            if used <= self._memory_budget:
+                break
+            if state.name == exclude:
+                continue
+            self._release(state)
+            used -= state.estimated_bytes
+
+    def evict_idle(self):
+        now = time.time()
+        for state in self._eviction_order():
+            if now - state.last_access > self._idle_seconds:
+                self._release(state)
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.evict_idle()
+                if self._memory_budget:
+                    self.enforce_budget()
+            except Exception as e:
+                print(f"Error in residency manager: {str(e)}")
+
+    def stats(self):
+        return {
+            state.name: {
+                "loaded": state.loaded,
+                "pinned": state.name in self._pinned,
+                "last_access": state.last_access,
+                "frequency": state.frequency,
+                "estimated_bytes": state.estimated_bytes
+            }
+            for state in list(self._states.values())
+        }
@@ -0,0 +1,77 @@
+import json
+import hashlib
+from typing import List, Dict, Any, Optional
+
+def content_hash(document: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    payload = json.dumps({"document": document, "metadata": metadata or None}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class UpsertPlan:
+    def __init__(self, collection_name: str, documents: List[str],
+                 metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+                 ids: Optional[List[str]] = None):
+        metadatas = metadatas or [None] * len(documents)
+        hashes = [content_hash(document, metadata) for document, metadata in zip(documents, metadatas)]
+        ids = ids or hashes
+
+        latest = {}
+        for i, id_ in enumerate(ids):
+            latest[id_] = i
+
+        self.collection_name = collection_name
+        self.source_ids = ids
+        self.hashes = hashes
+        self.candidates = sorted(latest.values())
+        self.indices: List[int] = []
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.content_hashes: List[str] = []
+        self.replaced: Dict[str, Any] = {}
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = len(documents) - len(self.candidates)
+        self._all_documents = documents
+        self._all_metadatas = metadatas
+
+    @property
+    def candidate_ids(self) -> List[str]:
+        return [self.source_ids[i] for i in self.candidates]
+
+    def resolve(self, existing: Dict[str, Any], existing_hashes: Dict[str, str]):
+        for i in self.candidates:
+            id_ = self.source_ids[i]
+            if id_ in existing_hashes and existing_hashes[id_] == self.hashes[i]:
+                self.unchanged += 1
+                continue
+            if id_ in existing:
+                self.replaced[id_] = existing[id_]
+                self.updated += 1
+            else:
+                self.inserted += 1
+            self.indices.append(i)
+            self.ids.append(id_)
+            self.documents.append(self._all_documents[i])
+            self.metadatas.append(self._all_metadatas[i])
+            self.content_hashes.append(self.hashes[i])
+        return self
+
+    def select_embeddings(self, embeddings: Optional[List[List[float]]]) -> Optional[List[List[float]]]:
+        if embeddings is None:
+            return None
+        return [embeddings[i] for i in self.indices]
+
+    def stale_chunk_filter(self) -> Optional[Dict[str, Any]]:
+        # A re-chunked document that now splits into fewer chunks leaves its old trailing chunks behind. This
+        # matches them: every chunk of an updated parent whose index is past the parent's new chunk count.
+        counts = {}
+        for id_, metadata in zip(self.ids, self.metadatas):
+            if id_ in self.replaced and metadata and "parent_id" in metadata and "chunk_count" in metadata:
+                counts[metadata["parent_id"]] = metadata["chunk_count"]
+        clauses = [{"$and": [{"parent_id": parent}, {"chunk_index": {"$gte": count}}]} for parent, count in counts.items()]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+    def summary(self) -> Dict[str, int]:
+        return {"inserted": self.inserted, "updated": self.updated, "unchanged": self.unchanged}
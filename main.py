@@ -1,16 +1,80 @@
-from fastapi import FastAPI, HTTPException, Body, Query
-from typing import List, Dict, Optional, Any, Literal
-from utils import generate_embedding, rerank_results
+from services.startup import startup_report, warmup
+from fastapi import FastAPI, HTTPException, Body, Query, Request
+from typing import List, Dict, Optional, Any, Literal, Union
+from utils import agenerate_embeddings, get_embedding_cache, get_rerank_cache, get_result_cache, run_blocking, shutdown_executor, search_flight
+from services.embedder import Embedder
+from services.reranker import Reranker
+from services.ingest import IngestPipeline, FlushPolicy, list_ingestions
+from services.jobs import JobQueue
+from services.fanout import FanoutSearch
+from services.chunking import collapse_fetch_size, collapse_results, resolve_chunker
+from services.encoding import EmbeddingInput, FastJSONResponse, decode_embeddings, dumps, embedding_digest, encode_embedding
+from services.metrics import timed, in_flight, start_request_timings, server_timing_header, render_metrics, HTTP_REQUEST_SECONDS
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import time
+import json
 from database.factory import VectorStoreFactory
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Vector Store API")
+job_queue = JobQueue(VectorStoreFactory.get_client)
+fanout = FanoutSearch(VectorStoreFactory.get_client)
+
+startup_report.mark("import", startup_report.elapsed())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    VectorStoreFactory.start_health_monitor()
+    if os.getenv("MILVUS_PRELOAD_COLLECTIONS"):
+        await run_blocking(VectorStoreFactory.get_client, "milvus")
+    await job_queue.start()
+    if os.getenv("STARTUP_WARMUP", "false").lower() == "true":
+        start = time.perf_counter()
+        await warmup(VectorStoreFactory.get_client)
+        startup_report.mark("warmup", time.perf_counter() - start)
+    startup_report.mark("ready", startup_report.elapsed())
+    print(
+        f"Startup: import {startup_report.phases['import']:.3f}s, "
+        f"ready {startup_report.phases['ready']:.3f}s" +
+        (f", warmup {startup_report.phases['warmup']:.3f}s" if "warmup" in startup_report.phases else "")
+    )
+    yield
+    await job_queue.stop()
+    shutdown_executor()
+    VectorStoreFactory.close_all()
+    await Embedder().aclose()
+
+app = FastAPI(title="Vector Store API", lifespan=lifespan)
+
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    timings = start_request_timings()
+    start = time.perf_counter()
+    status = 500
+    try:
+        with in_flight("http"):
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status
+        )
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
 
 CHROMA_PATH = os.getenv("CHROMA_PATH", "/app/data")
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", os.path.join(CHROMA_PATH, "local"))
 MILVUS_URI = os.getenv("MILVUS_URI")
 MILVUS_TOKEN = os.getenv("MILVUS_TOKEN")
 
@@ -18,6 +82,8 @@ class EmbeddingData(BaseModel):
     documents: List[str]
     metadatas: Optional[List[Dict[str, Any]]] = None
     ids: Optional[List[str]] = None
+    embeddings: Optional[List[EmbeddingInput]] = None
+    embedding_dtype: Literal["float32", "float16"] = "float32"
 
 class QueryData(BaseModel):
     query_texts: List[str]
@@ -25,9 +91,28 @@ class QueryData(BaseModel):
     where: Optional[Dict[str, Any]] = None
     where_document: Optional[Dict[str, Any]] = None
     rerank: bool = False
+    rerank_top_m: Optional[int] = None
+    recall: Optional[float] = None
+    collapse: bool = False
+    query_embeddings: Optional[List[EmbeddingInput]] = None
+    embedding_dtype: Literal["float32", "float16"] = "float32"
+
+class SearchTarget(BaseModel):
+    vector_store: Literal["chroma", "milvus", "local"]
+    collection: str
+
+class FanoutQueryData(QueryData):
+    targets: List[SearchTarget]
+    timeout: Optional[float] = None
+
+class IndexRebuildData(BaseModel):
+    index_profile: Optional[Literal["FLAT", "IVF_FLAT", "IVF_SQ8", "HNSW"]] = None
+    index_params: Optional[Dict[str, Any]] = None
 
 class EmbeddingRequest(BaseModel):
-    input: str
+    input: Union[str, List[str]]
+    encoding_format: Literal["float", "base64"] = "float"
+    embedding_dtype: Literal["float32", "float16"] = "float32"
 
 class EmbeddingResponse(BaseModel):
     object: str = "list"
@@ -39,53 +124,98 @@ class EmbeddingResponse(BaseModel):
 async def root():
     return {
         "message": "Vector Store API is running",
-        "available_stores": ["chroma", "milvus"],
+        "available_stores": ["chroma", "milvus", "local"],
         "chroma_path": CHROMA_PATH,
+        "local_path": LOCAL_STORE_PATH,
         "milvus_available": bool(MILVUS_URI and MILVUS_TOKEN)
     }
 
 @app.post("/v1/embeddings", response_model=EmbeddingResponse)
 async def embeddings(request: EmbeddingRequest):
-    input_text = request.input
-    if not input_text:
+    texts = [request.input] if isinstance(request.input, str) else request.input
+    if not texts or not all(texts):
         raise HTTPException(status_code=400, detail="No input text provided")
 
-    # Generate embeddings
-    embeddings = generate_embedding(input_text)
+    embedder = Embedder()
+    with timed("embed"):
+        embeddings = await agenerate_embeddings(texts)
+
+    if request.encoding_format == "base64":
+        embeddings = [encode_embedding(embedding, request.embedding_dtype) for embedding in embeddings]
 
     # Construct the response in OpenAI format
+    prompt_tokens = sum(embedder.estimate_tokens(text) for text in texts)
     response = {
         "object": "list",
-        "data": [{"object": "embedding", "embedding": embeddings, "index": 0}],
-        "model": "BAAI/bge-base-en-v1.5",
+        "data": [{"object": "embedding", "embedding": embedding, "index": i} for i, embedding in enumerate(embeddings)],
+        "model": embedder.model,
         "usage": {
-            "prompt_tokens": len(input_text.split()),
-            "total_tokens": len(input_text.split()),
+            "prompt_tokens": prompt_tokens,
+            "total_tokens": prompt_tokens,
         },
     }
 
-    return response
+    with timed("serialize"):
+        return FastJSONResponse(content=response)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+async def health():
+    return {
+        "vector_stores": await run_blocking(VectorStoreFactory.check_health),
+        "startup": startup_report.summary()
+    }
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "embedding": get_embedding_cache().stats(),
+        "rerank": get_rerank_cache().stats(),
+        "query_result": get_result_cache().stats()
+    }
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    return {
+        "embedding": Embedder().scheduler_stats(),
+        "rerank": Reranker().scheduler_stats()
+    }
 
 @app.get("/collections")
-async def list_collections(vector_store: Literal["chroma", "milvus"] = Query(..., description="Vector store to use")):
-    client = VectorStoreFactory.get_client(vector_store)
+async def list_collections(vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use")):
+    client = await run_blocking(VectorStoreFactory.get_client, vector_store)
     if not client:
         raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
     
-    collections = client.list_collections()
+    collections = await run_blocking(client.list_collections)
     return {"collections": collections}
 
 @app.post("/collections/{collection_name}")
 async def create_collection(
     collection_name: str,
-    vector_store: Literal["chroma", "milvus"] = Query(..., description="Vector store to use")
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use"),
+    partition_key: Optional[str] = Query(None, description="Metadata field used as the Milvus partition key"),
+    index_profile: Optional[Literal["FLAT", "IVF_FLAT", "IVF_SQ8", "HNSW"]] = Query(None, description="Milvus index profile"),
+    expected_rows: Optional[int] = Query(None, description="Expected row count, used to size nlist")
 ):
     try:
-        client = VectorStoreFactory.get_client(vector_store)
+        client = await run_blocking(VectorStoreFactory.get_client, vector_store)
         if not client:
             raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
         
-        collection = client.create_collection(name=collection_name)
+        if vector_store == "milvus":
+            await run_blocking(
+                client.create_collection,
+                name=collection_name,
+                partition_key=partition_key,
+                index_profile=index_profile,
+                expected_rows=expected_rows
+            )
+        else:
+            await run_blocking(client.create_collection, name=collection_name)
         return {"message": f"Collection '{collection_name}' created successfully in {vector_store}"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -93,39 +223,42 @@ async def create_collection(
 @app.get("/collections/{collection_name}")
 async def get_collection(
     collection_name: str,
-    vector_store: Literal["chroma", "milvus"] = Query(..., description="Vector store to use")
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use")
 ):
     try:
-        client = VectorStoreFactory.get_client(vector_store)
+        client = await run_blocking(VectorStoreFactory.get_client, vector_store)
         if not client:
             raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
         
-        collection = client.get_collection(collection_name)
+        def describe():
+            collection = client.get_collection(collection_name)
+            
+            if vector_store in ("chroma", "local"):
+                return {
+                    "name": collection.name,
+                    "count": collection.count()
+                }
+            else:
+                return {
+                    "name": collection_name,
+                    "count": collection.num_entities
+                }
         
-        if vector_store == "chroma":
-            return {
-                "name": collection.name,
-                "count": collection.count()
-            }
-        else:
-            return {
-                "name": collection_name,
-                "count": collection.num_entities
-            }
+        return await run_blocking(describe)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Collection not found: {str(e)}")
 
 @app.delete("/collections/{collection_name}")
 async def delete_collection(
     collection_name: str,
-    vector_store: Literal["chroma", "milvus"] = Query(..., description="Vector store to use")
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use")
 ):
     try:
-        client = VectorStoreFactory.get_client(vector_store)
+        client = await run_blocking(VectorStoreFactory.get_client, vector_store)
         if not client:
             raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
         
-        client.delete_collection(collection_name)
+        await run_blocking(client.delete_collection, collection_name)
         return {"message": f"Collection '{collection_name}' deleted successfully from {vector_store}"}
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Collection not found: {str(e)}")
@@ -134,44 +267,231 @@ async def delete_collection(
 async def add_documents(
     collection_name: str,
     data: EmbeddingData,
-    vector_store: Literal["chroma", "milvus"] = Query(..., description="Vector store to use")
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use"),
+    background: bool = Query(False, description="Queue the documents as a background job and return its id"),
+    chunk: Optional[bool] = Query(None, description="Split documents into overlapping token-bounded chunks (default CHUNKING_ENABLED)"),
+    chunk_tokens: Optional[int] = Query(None, ge=1, description="Maximum estimated tokens per chunk"),
+    chunk_overlap: Optional[int] = Query(None, ge=0, description="Estimated tokens shared by consecutive chunks")
 ):
     try:
-        client = VectorStoreFactory.get_client(vector_store)
+        client = await run_blocking(VectorStoreFactory.get_client, vector_store)
         if not client:
             raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
         
-        client.add_documents(
-            collection_name=collection_name,
-            documents=data.documents,
-            metadatas=data.metadatas,
-            ids=data.ids
-        )
-        return {"message": f"Added {len(data.documents)} documents to collection '{collection_name}' in {vector_store}"}
+        if data.embeddings is not None and len(data.embeddings) != len(data.documents):
+            raise ValueError("embeddings must have one entry per document")
+        
+        documents, metadatas, ids = data.documents, data.metadatas, data.ids
+        chunker = resolve_chunker(chunk, chunk_tokens, chunk_overlap)
+        if chunker:
+            if data.embeddings is not None:
+                raise ValueError("Client-supplied embeddings cannot be combined with chunking")
+            documents, metadatas, ids = chunker.split(documents, metadatas, ids)
+        chunks = {"chunks": len(documents)} if chunker else {}
+        
+        if background:
+            if data.embeddings is not None:
+                raise ValueError("Client-supplied embeddings are not supported for background jobs")
+            job = await job_queue.enqueue(vector_store, collection_name, documents, metadatas, ids)
+            return JSONResponse(status_code=202, content={"job_id": job["id"], "status": job["status"], "total": job["total"], **chunks})
+        
+        with timed("upsert_plan"):
+            plan = await run_blocking(client.plan_documents, collection_name, documents, metadatas, ids)
+        embeddings = None
+        if data.embeddings is not None:
+            embeddings = plan.select_embeddings(decode_embeddings(data.embeddings, data.embedding_dtype))
+        elif plan.documents:
+            with timed("embed"):
+                embeddings = await agenerate_embeddings(plan.documents)
+        summary = await run_blocking(client.write_documents, plan, embeddings)
+        return {
+            "message": f"Added {len(data.documents)} documents to collection '{collection_name}' in {vector_store}",
+            **chunks,
+            **summary
+        }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/collections/{collection_name}/stream")
+async def stream_documents(
+    collection_name: str,
+    request: Request,
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use"),
+    batch_size: Optional[int] = Query(None, description="Documents per embedding/insert batch"),
+    concurrency: Optional[int] = Query(None, description="Concurrent embedding requests"),
+    flush_every: int = Query(0, description="Flush after this many inserted documents (0 disables)"),
+    flush_interval: float = Query(0, description="Flush after this many seconds (0 disables)"),
+    flush_at_end: bool = Query(True, description="Flush once the stream is complete"),
+    chunk: Optional[bool] = Query(None, description="Split documents into overlapping token-bounded chunks (default CHUNKING_ENABLED)"),
+    chunk_tokens: Optional[int] = Query(None, ge=1, description="Maximum estimated tokens per chunk"),
+    chunk_overlap: Optional[int] = Query(None, ge=0, description="Estimated tokens shared by consecutive chunks")
+):
+    client = await run_blocking(VectorStoreFactory.get_client, vector_store)
+    if not client:
+        raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
+
+    try:
+        chunker = resolve_chunker(chunk, chunk_tokens, chunk_overlap)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    pipeline = IngestPipeline(
+        client,
+        collection_name,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        flush_policy=FlushPolicy(every=flush_every, interval=flush_interval, at_end=flush_at_end),
+        chunker=chunker
+    )
+    try:
+        return await pipeline.run(request.stream())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={"error": str(e), "progress": pipeline.progress})
+
+@app.get("/ingestions")
+async def ingestions():
+    return {"ingestions": list_ingestions()}
+
+@app.get("/jobs")
+async def list_jobs(
+    status: Optional[Literal["queued", "running", "completed", "failed"]] = None,
+    collection: Optional[str] = None,
+    limit: int = 100
+):
+    return {
+        "jobs": await run_blocking(job_queue.list, status, collection, limit),
+        **await run_blocking(job_queue.stats)
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_blocking(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
 @app.post("/collections/{collection_name}/query")
 async def query_collection(
     collection_name: str,
     data: QueryData,
-    vector_store: Literal["chroma", "milvus"] = Query(..., description="Vector store to use")
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use")
 ):
     try:
-        client = VectorStoreFactory.get_client(vector_store)
+        client = await run_blocking(VectorStoreFactory.get_client, vector_store)
         if not client:
             raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
         
-        results = client.query(
+        query_embeddings = None
+        if data.query_embeddings is not None:
+            if len(data.query_embeddings) != len(data.query_texts):
+                raise ValueError("query_embeddings must have one entry per query text")
+            query_embeddings = decode_embeddings(data.query_embeddings, data.embedding_dtype)
+        
+        cache = get_result_cache()
+        cache_params = {
+            "n_results": data.n_results,
+            "where": data.where,
+            "where_document": data.where_document,
+            "rerank": data.rerank,
+            "rerank_top_m": data.rerank_top_m,
+            "recall": data.recall,
+            "collapse": data.collapse
+        }
+        if query_embeddings is not None:
+            # Client-supplied vectors are part of the cache key, otherwise the same texts with other vectors would collide.
+            cache_params["embeddings"] = embedding_digest(query_embeddings)
+        generation = cache.generation(vector_store, collection_name)
+        cached = cache.get(vector_store, collection_name, data.query_texts, cache_params)
+        if cached is not None:
+            startup_report.record_query()
+            return FastJSONResponse(content=cached, headers={"X-Cache": "hit"})
+        
+        if query_embeddings is None:
+            with timed("embed"):
+                query_embeddings = await agenerate_embeddings(data.query_texts)
+        
+        cached = cache.get_similar(vector_store, collection_name, query_embeddings, cache_params)
+        if cached is not None:
+            startup_report.record_query()
+            return FastJSONResponse(content=cached, headers={"X-Cache": "semantic-hit"})
+        
+        search_key = (
+            vector_store,
+            collection_name,
+            generation,
+            json.dumps({"query_texts": data.query_texts, **cache_params}, sort_keys=True, default=str)
+        )
+        results = await search_flight.ado(search_key, lambda: run_blocking(
+            client.query,
             collection_name=collection_name,
             query_texts=data.query_texts,
+            n_results=collapse_fetch_size(data.n_results) if data.collapse else data.n_results,
+            where=data.where,
+            where_document=data.where_document,
+            rerank=data.rerank,
+            query_embeddings=query_embeddings,
+            rerank_top_m=data.rerank_top_m,
+            recall=data.recall
+        ))
+        if data.collapse:
+            results = collapse_results(results, data.n_results)
+        cache.put(vector_store, collection_name, data.query_texts, cache_params, results, generation, query_embeddings)
+        startup_report.record_query()
+        
+        with timed("serialize"):
+            return FastJSONResponse(content=results, headers={"X-Cache": "miss"})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/search")
+async def fanout_search(data: FanoutQueryData):
+    try:
+        if not data.targets:
+            raise ValueError("At least one target is required")
+        
+        if data.query_embeddings is not None:
+            if len(data.query_embeddings) != len(data.query_texts):
+                raise ValueError("query_embeddings must have one entry per query text")
+            query_embeddings = decode_embeddings(data.query_embeddings, data.embedding_dtype)
+        else:
+            with timed("embed"):
+                query_embeddings = await agenerate_embeddings(data.query_texts)
+        
+        results = await fanout.search(
+            [(target.vector_store, target.collection) for target in data.targets],
+            data.query_texts,
+            query_embeddings,
             n_results=data.n_results,
             where=data.where,
             where_document=data.where_document,
-            rerank=data.rerank
+            rerank=data.rerank,
+            rerank_top_m=data.rerank_top_m,
+            recall=data.recall,
+            timeout=data.timeout,
+            collapse=data.collapse
         )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if all(status["status"] != "ok" for status in results["target_status"]):
+        raise HTTPException(status_code=502, detail={"error": "All search targets failed", "target_status": results["target_status"]})
+    startup_report.record_query()
+    
+    with timed("serialize"):
+        return FastJSONResponse(content=results)
+
+@app.post("/admin/collections/{collection_name}/index")
+async def rebuild_index(
+    collection_name: str,
+    data: IndexRebuildData = Body(IndexRebuildData()),
+    vector_store: Literal["milvus"] = Query("milvus", description="Vector store to use")
+):
+    try:
+        client = await run_blocking(VectorStoreFactory.get_client, vector_store)
+        if not client:
+            raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
         
-        return results
+        return await run_blocking(client.rebuild_index, collection_name, data.index_profile, data.index_params)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -179,44 +499,63 @@ async def query_collection(
 async def peek_collection(
     collection_name: str, 
     limit: int = 10,
-    vector_store: Literal["chroma", "milvus"] = Query(..., description="Vector store to use")
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use")
 ):
     try:
-        client = VectorStoreFactory.get_client(vector_store)
+        client = await run_blocking(VectorStoreFactory.get_client, vector_store)
         if not client:
             raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
         
-        if vector_store == "chroma":
-            return client.peek(collection_name, limit=limit)
-        else:
-            collection = client.get_collection(collection_name)
-            collection.load()
-            
-            total_count = collection.num_entities
-            
-            if total_count == 0:
-                collection.release()
-                return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
-            
-            results = collection.query(
-                expr="id >= 0",
-                output_fields=["id", "text", "metadata"],
-                limit=limit
-            )
-            
-            formatted_results = {
-                "ids": [str(item["id"]) for item in results],
-                "documents": [item["text"] for item in results],
-                "metadatas": [item["metadata"] for item in results],
-                "embeddings": [] 
-            }
-            
-            collection.release()
-            return formatted_results
+        return await run_blocking(client.peek, collection_name, limit=limit)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/collections/{collection_name}/export")
+async def export_collection(
+    collection_name: str,
+    vector_store: Literal["chroma", "milvus", "local"] = Query(..., description="Vector store to use"),
+    cursor: Optional[str] = Query(None, description="Resume after this cursor from an earlier export"),
+    batch_size: int = Query(1000, ge=1, le=16384, description="Records fetched per page"),
+    include_embeddings: bool = Query(False, description="Include base64-encoded embeddings"),
+    embedding_dtype: Literal["float32", "float16"] = Query("float32", description="Encoding of exported embeddings"),
+    checkpoints: bool = Query(False, description="Emit a {\"cursor\": ...} line after every page")
+):
+    client = await run_blocking(VectorStoreFactory.get_client, vector_store)
+    if not client:
+        raise HTTPException(status_code=400, detail=f"{vector_store.capitalize()} client not configured")
+    
+    # Every backend's cursor is a non-negative integer (an offset or the last primary key), so a malformed one is
+    # rejected here rather than surfacing as a missing collection.
+    if cursor is not None and not (cursor.isascii() and cursor.isdigit()):
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor!r}")
+    
+    pages = client.export_pages(collection_name, cursor=cursor, batch_size=batch_size, include_embeddings=include_embeddings)
+    try:
+        # Fetch the first page before responding so a missing collection is a 404 instead of a broken stream.
+        page = await run_blocking(next, pages, None)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Collection not found: {str(e)}")
+    
+    async def lines():
+        nonlocal page
+        try:
+            while page is not None:
+                records, next_cursor = page
+                if include_embeddings:
+                    for record in records:
+                        record["embedding"] = encode_embedding(record["embedding"], embedding_dtype)
+                chunk = b"\n".join(dumps(record) for record in records) + b"\n"
+                if checkpoints:
+                    chunk += dumps({"cursor": next_cursor}) + b"\n"
+                yield chunk
+                page = await run_blocking(next, pages, None)
+        finally:
+            await run_blocking(pages.close)
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8003))
+    os.environ.setdefault("RESULT_CACHE_SINGLE_WORKER", "true")
     uvicorn.run(app, host="0.0.0.0", port=port) 
\ No newline at end of file
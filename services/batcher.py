@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Any
+
+class MicroBatcher:
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_batch_size: int = None,
+                 max_wait_ms: float = None, max_concurrency: int = None):
+        self._fn = fn
+        self._max_batch_size = max_batch_size or int(os.getenv("EMBEDDING_MICROBATCH_SIZE", 64))
+        self._max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBEDDING_MICROBATCH_WAIT_MS", 5))) / 1000
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        # Flushed batches run on their own pool rather than the shared store executor: store calls on that
+        # executor block on micro-batched embeddings, so sharing it could leave no thread to run the batch.
+        self._dispatcher = ThreadPoolExecutor(
+            max_workers=max_concurrency or int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 8)),
+            thread_name_prefix="embedding-batch"
+        )
+        self._thread = threading.Thread(target=self._run, name="embedding-microbatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._pending.append((item, future))
+            self._cond.notify()
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._dispatcher.shutdown(wait=True)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+
+            deadline = time.monotonic() + self._max_wait
+            while len(self._pending) < self._max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self._max_batch_size]
+            self._pending = self._pending[self._max_batch_size:]
+            return batch
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = self._fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._dispatcher.submit(self._dispatch, batch)
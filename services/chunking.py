@@ -0,0 +1,122 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from database.upsert import content_hash
+
+_PIECE = re.compile(r"\S+\s*")
+
+def estimate_tokens(piece: str) -> int:
+    # Close to what BPE tokenizers do on prose: short words cost one token, long ones about one per 4 characters.
+    return max(1, (len(piece.strip()) + 3) // 4)
+
+def _pieces(text: str, max_tokens: int) -> List[Tuple[int, int, int]]:
+    # Text without whitespace (CJK, base64, long URLs) is one piece per run, so runs over the chunk size are
+    # cut by characters at the width the token estimate allows.
+    width = max_tokens * 4
+    pieces = []
+    for match in _PIECE.finditer(text):
+        tokens = estimate_tokens(match.group())
+        if tokens <= max_tokens:
+            pieces.append((match.start(), match.end(), tokens))
+            continue
+        stop = match.start() + len(match.group().rstrip())
+        for begin in range(match.start(), stop, width):
+            finish = min(begin + width, stop)
+            pieces.append((begin, match.end() if finish == stop else finish, estimate_tokens(text[begin:finish])))
+    return pieces
+
+def chunk_text(text: str, max_tokens: int, overlap: int = 0) -> List[Tuple[int, int, str]]:
+    pieces = _pieces(text, max_tokens)
+    if not pieces:
+        return [(0, len(text), text)]
+
+    chunks = []
+    start = 0
+    while start < len(pieces):
+        end = start
+        tokens = 0
+        while end < len(pieces) and (end == start or tokens + pieces[end][2] <= max_tokens):
+            tokens += pieces[end][2]
+            end += 1
+        begin, finish = pieces[start][0], pieces[end - 1][1]
+        chunks.append((begin, finish, text[begin:finish].rstrip()))
+        if end >= len(pieces):
+            break
+        # Step back over up to `overlap` tokens, but always move forward by at least one piece and leave room
+        # for the next piece, otherwise the next chunk would end where this one did.
+        back = end
+        carried = 0
+        budget = min(overlap, max_tokens - pieces[end][2])
+        while back - 1 > start and carried + pieces[back - 1][2] <= budget:
+            back -= 1
+            carried += pieces[back][2]
+        start = back
+    return chunks
+
+class Chunker:
+    def __init__(self, max_tokens: int = None, overlap: int = None):
+        self.max_tokens = max_tokens or int(os.getenv("CHUNK_MAX_TOKENS", 512))
+        if overlap is None:
+            overlap = min(int(os.getenv("CHUNK_OVERLAP_TOKENS", 64)), self.max_tokens // 4)
+        self.overlap = overlap
+        if self.overlap >= self.max_tokens:
+            raise ValueError("Chunk overlap must be smaller than the chunk size")
+
+    def split(self, documents: List[str], metadatas: Optional[List[Optional[Dict[str, Any]]]] = None,
+              ids: Optional[List[str]] = None) -> Tuple[List[str], List[Dict[str, Any]], List[str]]:
+        metadatas = metadatas or [None] * len(documents)
+        chunk_documents, chunk_metadatas, chunk_ids = [], [], []
+        for i, (document, metadata) in enumerate(zip(documents, metadatas)):
+            parent_id = ids[i] if ids else content_hash(document, metadata)
+            chunks = chunk_text(document, self.max_tokens, self.overlap)
+            for n, (start, end, text) in enumerate(chunks):
+                chunk_documents.append(text)
+                chunk_metadatas.append({
+                    **(metadata or {}),
+                    "parent_id": parent_id,
+                    "chunk_index": n,
+                    "chunk_count": len(chunks),
+                    "chunk_start": start,
+                    "chunk_end": end
+                })
+                chunk_ids.append(f"{parent_id}#{n}")
+        return chunk_documents, chunk_metadatas, chunk_ids
+
+def collapse_results(results: Dict[str, Any], n_results: int) -> Dict[str, Any]:
+    # Keeps the best-ranked chunk of each parent document, in the order the hits already have, and reports
+    # the parent id together with every chunk of it that matched.
+    keys = [key for key in ("ids", "distances", "metadatas", "documents", "targets") if results.get(key) is not None]
+    collapsed = {key: [] for key in keys}
+    collapsed["chunk_ids"] = []
+    for q in range(len(results["ids"])):
+        rows = {key: [] for key in keys}
+        chunk_ids = []
+        positions = {}
+        for i, id_ in enumerate(results["ids"][q]):
+            metadata = (results["metadatas"][q][i] if results.get("metadatas") else None) or {}
+            parent = metadata.get("parent_id", id_)
+            target = results["targets"][q][i] if results.get("targets") else None
+            group = (target["vector_store"], target["collection"], parent) if target else parent
+            if group in positions:
+                chunk_ids[positions[group]].append(id_)
+                continue
+            if len(chunk_ids) >= n_results:
+                continue
+            positions[group] = len(chunk_ids)
+            chunk_ids.append([id_])
+            for key in keys:
+                rows[key].append(parent if key == "ids" else results[key][q][i])
+        for key in keys:
+            collapsed[key].append(rows[key])
+        collapsed["chunk_ids"].append(chunk_ids)
+    return {**results, **collapsed}
+
+def collapse_fetch_size(n_results: int) -> int:
+    # Several chunks of one document can fill the top-k, so collapsing searches deeper than it returns.
+    return n_results * int(os.getenv("CHUNK_COLLAPSE_OVERFETCH", 4))
+
+def resolve_chunker(enabled: Optional[bool] = None, max_tokens: Optional[int] = None,
+                    overlap: Optional[int] = None) -> Optional[Chunker]:
+    if enabled is None:
+        enabled = os.getenv("CHUNKING_ENABLED", "false").lower() == "true"
+    return Chunker(max_tokens, overlap) if enabled else None
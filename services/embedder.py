@@ -3,7 +3,9 @@ import os
 import numpy as np
 # import ctranslate2
 # from transformers import AutoTokenizer
-from openai import OpenAI
+import asyncio
+from services.scheduler import UpstreamScheduler
+from services.encoding import decode_embedding
 class Embedder:
     _instance = None
     
@@ -15,6 +17,14 @@ class Embedder:
             cls._instance._model_name = model_name or os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
             cls._instance._device = os.getenv("EMBEDDING_DEVICE", "cpu")
             cls._instance._model_save_path = os.getenv("EMBEDDING_MODEL_PATH", "bge_model_ctranslate2")
+            cls._instance._client = None
+            cls._instance._async_client = None
+            cls._instance._scheduler = UpstreamScheduler("embedding", "EMBEDDING", default_max_concurrency=8)
+            cls._instance._api_model = os.getenv("EMBEDDING_API_MODEL", "baai/bge-m3")
+            cls._instance._base_url = os.getenv("EMBEDDING_BASE_URL", "https://integrate.api.nvidia.com/v1")
+            cls._instance._batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+            cls._instance._batch_tokens = int(os.getenv("EMBEDDING_BATCH_TOKENS", 32768))
+            cls._instance._encoding_format = os.getenv("EMBEDDING_ENCODING_FORMAT", "base64")
         return cls._instance
     
     # def _load_model(self):
@@ -53,17 +63,108 @@ class Embedder:
     #         embeddings = last_hidden_state.detach().tolist()[0]
             
     #     return embeddings 
-    def generate_embedding(self,text):
-        client = OpenAI(
-            api_key=os.getenv("NVIDIA_API_KEY"),
-            base_url="https://integrate.api.nvidia.com/v1"
-        )
-
-        response = client.embeddings.create(
-            input=[text],
-            model="baai/bge-m3",
-            encoding_format="float",
-            extra_body={"truncate": "NONE"}
-        )
-
-        return (response.data[0].embedding)
\ No newline at end of file
+    def _get_client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(
+                api_key=os.getenv("NVIDIA_API_KEY"),
+                base_url=self._base_url,
+                timeout=self._scheduler.timeout,
+                max_retries=0
+            )
+        return self._client
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(
+                api_key=os.getenv("NVIDIA_API_KEY"),
+                base_url=self._base_url,
+                timeout=self._scheduler.timeout,
+                max_retries=0
+            )
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    @property
+    def model(self):
+        return self._api_model
+
+    @property
+    def max_concurrency(self):
+        return self._scheduler.limiter.maximum
+
+    def scheduler_stats(self):
+        return self._scheduler.stats()
+
+    def estimate_tokens(self, text):
+        return len(text) // 4 + 1
+
+    def _make_batches(self, texts):
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = self.estimate_tokens(text)
+            if batch and (len(batch) >= self._batch_size or batch_tokens + tokens > self._batch_tokens):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(i)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def generate_embeddings(self, texts):
+        if not texts:
+            return []
+
+        client = self._get_client()
+        embeddings = [None] * len(texts)
+        for batch in self._make_batches(texts):
+            batch_texts = [texts[i] for i in batch]
+            response = self._scheduler.call(
+                lambda: client.embeddings.create(
+                    input=batch_texts,
+                    model=self._api_model,
+                    encoding_format=self._encoding_format,
+                    extra_body={"truncate": "NONE"}
+                ),
+                tokens=sum(self.estimate_tokens(text) for text in batch_texts)
+            )
+            for item in response.data:
+                embeddings[batch[item.index]] = decode_embedding(item.embedding)
+
+        return embeddings
+
+    def generate_embedding(self, text):
+        return self.generate_embeddings([text])[0]
+
+    async def agenerate_embeddings(self, texts):
+        if not texts:
+            return []
+
+        client = self._get_async_client()
+        embeddings = [None] * len(texts)
+
+        async def embed_batch(batch):
+            batch_texts = [texts[i] for i in batch]
+            response = await self._scheduler.acall(
+                lambda: client.embeddings.create(
+                    input=batch_texts,
+                    model=self._api_model,
+                    encoding_format=self._encoding_format,
+                    extra_body={"truncate": "NONE"}
+                ),
+                tokens=sum(self.estimate_tokens(text) for text in batch_texts)
+            )
+            for item in response.data:
+                embeddings[batch[item.index]] = decode_embedding(item.embedding)
+
+        await asyncio.gather(*(embed_batch(batch) for batch in self._make_batches(texts)))
+        return embeddings
@@ -0,0 +1,234 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional
+import numpy as np
+from services.metrics import count_cache
+from services.shared_cache import SharedTable
+
+_INDEX_RECORD = np.dtype([("key", "V16"), ("slot", "<i8")])
+
+class DiskEmbeddingStore:
+    # Several worker processes may share one path. Every change to the files happens under an flock, and a
+    # new vector's slot comes from the file size at that moment, so writers never hand out the same row.
+    # Index records written by other processes are picked up incrementally.
+    def __init__(self, path: str, dtype: str = "float32"):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        os.makedirs(path, exist_ok=True)
+        self._meta_path = os.path.join(path, "meta.json")
+        self._index_path = os.path.join(path, "index.bin")
+        self._vectors_path = os.path.join(path, f"vectors.{self.dtype.name}.bin")
+        self._dim = None
+        self._index = {}
+        self._index_offset = 0
+        self._mmap = None
+        self._mapped_rows = 0
+        self._rows = 0
+        self._lock_file = open(os.path.join(path, "lock"), "a+b")
+        self._vectors_file = open(self._vectors_path, "ab")
+        self._index_file = open(self._index_path, "ab")
+        with self._file_lock():
+            self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _row_bytes(self) -> int:
+        return self._dim * self.dtype.itemsize
+
+    def _read_meta(self):
+        if self._dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if meta.get("dtype") != self.dtype.name:
+                raise ValueError(f"Embedding cache at {self.path} uses {meta.get('dtype')}, not {self.dtype.name}")
+            self._dim = meta["dim"]
+
+    def _load(self):
+        # Called with the file lock held: a partial row left by a crashed writer is cut off before anyone appends.
+        self._read_meta()
+        if self._dim is None:
+            return
+        size = os.path.getsize(self._vectors_path)
+        if size % self._row_bytes():
+            os.truncate(self._vectors_path, size - size % self._row_bytes())
+        self._rows = os.path.getsize(self._vectors_path) // self._row_bytes()
+        self._read_index()
+
+    def _read_index(self):
+        size = os.path.getsize(self._index_path)
+        size -= size % _INDEX_RECORD.itemsize
+        if size <= self._index_offset:
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_offset)
+            raw = f.read(size - self._index_offset)
+        self._index_offset = size
+        records = np.frombuffer(raw, dtype=_INDEX_RECORD)
+        rows = os.path.getsize(self._vectors_path) // self._row_bytes()
+        for key, slot in zip(records["key"], records["slot"]):
+            if slot < rows:
+                self._index[key.tobytes()] = int(slot)
+        self._rows = max(self._rows, rows)
+
+    def _remap(self):
+        self._mmap = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(self._rows, self._dim))
+        self._mapped_rows = self._rows
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def nbytes(self) -> int:
+        return self._rows * (self._dim or 0) * self.dtype.itemsize
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        slot = self._index.get(key)
+        if slot is None and os.path.getsize(self._index_path) > self._index_offset:
+            self._read_meta()
+            if self._dim is not None:
+                self._read_index()
+                slot = self._index.get(key)
+        if slot is None:
+            return None
+        if slot >= self._mapped_rows:
+            self._remap()
+        return np.array(self._mmap[slot], dtype=np.float32)
+
+    def put(self, key: bytes, vector: np.ndarray):
+        if key in self._index:
+            return
+        with self._file_lock():
+            self._read_meta()
+            if self._dim is None:
+                self._dim = int(vector.shape[0])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self._dim, "dtype": self.dtype.name}, f)
+            if vector.shape[0] != self._dim:
+                return
+            self._read_index()
+            if key in self._index:
+                return
+
+            slot = os.path.getsize(self._vectors_path) // self._row_bytes()
+            self._vectors_file.write(vector.astype(self.dtype).tobytes())
+            self._vectors_file.flush()
+            self._index_file.write(key + np.int64(slot).tobytes())
+            self._index_file.flush()
+            self._index_offset += _INDEX_RECORD.itemsize
+            self._index[key] = slot
+            self._rows = slot + 1
+
+    def close(self):
+        self._mmap = None
+        self._mapped_rows = 0
+        self._vectors_file.close()
+        self._index_file.close()
+        self._lock_file.close()
+
+class EmbeddingCache:
+    def __init__(self, max_bytes: int = None, disk_path: str = None, disk_dtype: str = None):
+        self._max_bytes = max_bytes if max_bytes is not None else int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+        disk_path = disk_path or os.getenv("EMBEDDING_CACHE_PATH")
+        disk_dtype = disk_dtype or os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+        self._disk = DiskEmbeddingStore(disk_path, disk_dtype) if disk_path else None
+        shared_path = os.getenv("EMBEDDING_CACHE_SHARED_PATH")
+        self._shared = SharedTable(
+            shared_path, int(os.getenv("EMBEDDING_CACHE_SHARED_SLOTS", 65536)), disk_dtype
+        ) if shared_path else None
+        self._memory = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._bytes += vector.nbytes
+        while self._bytes > self._max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                count_cache("embedding", True)
+                return vector.tolist()
+
+            if self._shared is not None:
+                vector = self._shared.get(key)
+                if vector is not None:
+                    vector = vector.astype(np.float32)
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.shared_hits += 1
+                    count_cache("embedding_shared", True)
+                    return vector.tolist()
+
+            if self._disk is not None:
+                vector = self._disk.get(key)
+                if vector is not None:
+                    self._remember(key, vector)
+                    if self._shared is not None:
+                        self._shared.put(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    count_cache("embedding_disk", True)
+                    return vector.tolist()
+
+            self.misses += 1
+            count_cache("embedding", False)
+            return None
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        key = self.make_key(model, text)
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self._shared is not None:
+                self._shared.put(key, vector)
+            if self._disk is not None:
+                self._disk.put(key, vector)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._memory),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+                "disk_bytes": self._disk.nbytes if self._disk is not None else 0,
+                "shared": self._shared.stats() if self._shared is not None else None
+            }
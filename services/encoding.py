@@ -0,0 +1,51 @@
+import json
+import base64
+import hashlib
+from typing import Any, List, Sequence, Union
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EmbeddingInput = Union[List[float], str]
+
+_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2")
+}
+
+def _dtype(name: str) -> np.dtype:
+    if name not in _DTYPES:
+        raise ValueError(f"Unsupported embedding dtype '{name}', expected one of {sorted(_DTYPES)}")
+    return _DTYPES[name]
+
+def encode_embedding(embedding: Sequence[float], dtype: str = "float32") -> str:
+    return base64.b64encode(np.asarray(embedding, dtype=_dtype(dtype)).tobytes()).decode("ascii")
+
+def decode_embedding(value: EmbeddingInput, dtype: str = "float32") -> List[float]:
+    if not isinstance(value, str):
+        return value
+    vector = np.frombuffer(base64.b64decode(value), dtype=_dtype(dtype))
+    return vector.astype(np.float32).tolist()
+
+def decode_embeddings(values: List[EmbeddingInput], dtype: str = "float32") -> List[List[float]]:
+    embeddings = [decode_embedding(value, dtype) for value in values]
+    if len({len(embedding) for embedding in embeddings}) > 1:
+        raise ValueError("All embeddings must have the same dimension")
+    return embeddings
+
+def embedding_digest(embeddings: List[List[float]]) -> str:
+    return hashlib.blake2b(np.asarray(embeddings, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=str).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    # orjson serializes large float-heavy result sets several times faster than the stdlib encoder.
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,122 @@
+import os
+import time
+import heapq
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils import arerank_results, run_blocking
+from services.metrics import REGISTRY, timed
+from services.chunking import collapse_fetch_size, collapse_results
+
+FANOUT_TARGETS = REGISTRY.counter("vector_store_fanout_targets_total", "Fan-out search targets by outcome")
+
+def normalize_distance(vector_store: str, metric: str, value: float) -> float:
+    # Every score is mapped onto squared L2 between unit vectors (0 = identical, 4 = opposite), which is
+    # what the normalized embeddings from the embedder produce in the default "l2" spaces.
+    metric = metric.lower()
+    if metric == "l2":
+        return float(value)
+    if metric in ("ip", "cosine"):
+        # Chroma reports 1 - similarity, Milvus reports the similarity itself.
+        return 2.0 * float(value) if vector_store == "chroma" else 2.0 - 2.0 * float(value)
+    raise ValueError(f"Unsupported distance metric '{metric}'")
+
+class FanoutSearch:
+    def __init__(self, client_factory: Callable[[str], Any], timeout: Optional[float] = None):
+        self._client_factory = client_factory
+        self.timeout = timeout if timeout is not None else float(os.getenv("FANOUT_TARGET_TIMEOUT_SECONDS", 5.0))
+
+    def _search_target(self, vector_store: str, collection_name: str, query_texts: List[str],
+                       query_embeddings: List[List[float]], n_results: int, where, where_document, recall):
+        client = self._client_factory(vector_store)
+        if not client:
+            raise ValueError(f"{vector_store.capitalize()} client not configured")
+        metric = client.distance_metric(collection_name)
+        results = client.query(
+            collection_name=collection_name,
+            query_texts=query_texts,
+            n_results=n_results,
+            where=where,
+            where_document=where_document,
+            query_embeddings=query_embeddings,
+            recall=recall
+        )
+        grouped = []
+        for q in range(len(query_texts)):
+            ids = results["ids"][q] if q < len(results["ids"]) else []
+            metadatas = results.get("metadatas")
+            grouped.append([{
+                "id": ids[i],
+                "text": results["documents"][q][i],
+                "metadata": (metadatas[q][i] if metadatas else None) or {},
+                "distance": normalize_distance(vector_store, metric, results["distances"][q][i]),
+                "vector_store": vector_store,
+                "collection": collection_name
+            } for i in range(len(ids))])
+        return grouped
+
+    async def _run_target(self, target: Tuple[str, str], timeout: float, **kwargs):
+        vector_store, collection_name = target
+        start = time.perf_counter()
+        status = {"vector_store": vector_store, "collection": collection_name}
+        try:
+            # The blocking search keeps running on its worker after a timeout; only its result is dropped.
+            hits = await asyncio.wait_for(
+                run_blocking(self._search_target, vector_store, collection_name, **kwargs), timeout
+            )
+            status["status"] = "ok"
+        except asyncio.TimeoutError:
+            hits = None
+            status["status"] = "timeout"
+        except Exception as e:
+            hits = None
+            status["status"] = "error"
+            status["error"] = str(e)
+        status["elapsed_seconds"] = time.perf_counter() - start
+        FANOUT_TARGETS.inc(status=status["status"])
+        return hits, status
+
+    async def search(self, targets: List[Tuple[str, str]], query_texts: List[str],
+                     query_embeddings: List[List[float]], n_results: int = 10,
+                     where: Optional[Dict[str, Any]] = None, where_document: Optional[Dict[str, Any]] = None,
+                     rerank: bool = False, rerank_top_m: Optional[int] = None, recall: Optional[float] = None,
+                     timeout: Optional[float] = None, collapse: bool = False) -> Dict[str, Any]:
+        timeout = timeout if timeout is not None else self.timeout
+        limit = collapse_fetch_size(n_results) if collapse else n_results
+        outcomes = await asyncio.gather(*(
+            self._run_target(
+                target, timeout,
+                query_texts=query_texts,
+                query_embeddings=query_embeddings,
+                n_results=limit,
+                where=where,
+                where_document=where_document,
+                recall=recall
+            ) for target in dict.fromkeys(targets)
+        ))
+
+        with timed("fanout_merge"):
+            merged = []
+            for q in range(len(query_texts)):
+                hits = [hit for target_hits, _ in outcomes if target_hits for hit in target_hits[q]]
+                merged.append(heapq.nsmallest(limit, hits, key=lambda hit: hit["distance"]))
+
+        if rerank and any(merged):
+            merged = list(await asyncio.gather(*(
+                arerank_results(query, hits, top_m=rerank_top_m) if hits else asyncio.sleep(0, hits)
+                for query, hits in zip(query_texts, merged)
+            )))
+
+        statuses = [status for _, status in outcomes]
+        results = {
+            "ids": [[hit["id"] for hit in hits] for hits in merged],
+            "distances": [[hit["distance"] for hit in hits] for hits in merged],
+            "metadatas": [[hit["metadata"] for hit in hits] for hits in merged],
+            "documents": [[hit["text"] for hit in hits] for hits in merged],
+            "targets": [[{"vector_store": hit["vector_store"], "collection": hit["collection"]} for hit in hits] for hits in merged],
+            "embeddings": None,
+            "partial": any(status["status"] != "ok" for status in statuses),
+            "target_status": statuses
+        }
+        if rerank:
+            results["reranked"] = True
+        return collapse_results(results, n_results) if collapse else results
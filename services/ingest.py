@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from typing import AsyncIterator, Dict, Any, List, Optional
+from utils import agenerate_embeddings, run_blocking
+from services.chunking import Chunker
+from database.upsert import content_hash
+
+_active_ingestions: Dict[str, Dict[str, Any]] = {}
+
+def list_ingestions() -> List[Dict[str, Any]]:
+    return list(_active_ingestions.values())
+
+class FlushPolicy:
+    def __init__(self, every: int = 0, interval: float = 0, at_end: bool = True):
+        self.every = every
+        self.interval = interval
+        self.at_end = at_end
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, count: int) -> bool:
+        self._pending += count
+        if self.every and self._pending >= self.every:
+            return True
+        if self.interval and time.monotonic() - self._last_flush >= self.interval:
+            return True
+        return False
+
+    def flushed(self):
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+class IngestPipeline:
+    def __init__(self, client, collection_name: str, batch_size: int = None,
+                 concurrency: int = None, flush_policy: Optional[FlushPolicy] = None,
+                 chunker: Optional[Chunker] = None):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", 64))
+        self.concurrency = concurrency or int(os.getenv("INGEST_EMBED_CONCURRENCY", 4))
+        self.flush_policy = flush_policy or FlushPolicy()
+        self.chunker = chunker
+        self.progress = {
+            "id": uuid.uuid4().hex,
+            "collection": collection_name,
+            "started_at": time.time(),
+            "parsed": 0,
+            **({"chunks": 0} if chunker else {}),
+            "embedded": 0,
+            "inserted": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "flushes": 0,
+            "errors": 0,
+            "status": "running"
+        }
+        self._error = None
+
+    async def _parse(self, lines: AsyncIterator[bytes], embed_queue: asyncio.Queue):
+        batch = []
+        buffer = b""
+        line_number = 0
+
+        async def emit_line(line: bytes):
+            nonlocal line_number, batch
+            line_number += 1
+            if not line.strip():
+                return
+            try:
+                record = json.loads(line)
+                document = record["document"]
+            except (ValueError, KeyError, TypeError) as e:
+                self.progress["errors"] += 1
+                raise ValueError(f"Invalid NDJSON record on line {line_number}: {str(e)}")
+            if self._error is not None:
+                raise self._error
+            if self.chunker:
+                id_ = record.get("id")
+                chunks = self.chunker.split([document], [record.get("metadata")], [id_] if id_ is not None else None)
+                batch.extend(zip(*chunks))
+                self.progress["chunks"] += len(chunks[0])
+            else:
+                batch.append((document, record.get("metadata"), record.get("id")))
+            self.progress["parsed"] += 1
+            if len(batch) >= self.batch_size:
+                await embed_queue.put(batch)
+                batch = []
+
+        async for chunk in lines:
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                await emit_line(line)
+        await emit_line(buffer)
+
+        if batch:
+            await embed_queue.put(batch)
+
+    async def _embed(self, embed_queue: asyncio.Queue, insert_queue: asyncio.Queue):
+        while True:
+            batch = await embed_queue.get()
+            try:
+                if batch is None:
+                    return
+                if self._error is not None:
+                    continue
+                metadatas = [metadata for _, metadata, _ in batch]
+                # Records without an id get their content hash; supplied ids are kept as they are.
+                ids = [id_ if id_ is not None else content_hash(document, metadata) for document, metadata, id_ in batch]
+                plan = await run_blocking(
+                    self.client.plan_documents,
+                    self.collection_name,
+                    [document for document, _, _ in batch],
+                    metadatas if any(m is not None for m in metadatas) else None,
+                    ids
+                )
+                self.progress["unchanged"] += plan.unchanged
+                if not plan.ids:
+                    continue
+                embeddings = await agenerate_embeddings(plan.documents)
+                self.progress["embedded"] += len(plan.ids)
+                await insert_queue.put((plan, embeddings))
+            except Exception as e:
+                self._fail(e)
+            finally:
+                embed_queue.task_done()
+
+    def _fail(self, error: Exception):
+        if self._error is None:
+            self._error = error
+        self.progress["errors"] += 1
+
+    async def _flush(self):
+        await run_blocking(self.client.flush, self.collection_name)
+        self.flush_policy.flushed()
+        self.progress["flushes"] += 1
+
+    async def _insert(self, insert_queue: asyncio.Queue):
+        while True:
+            item = await insert_queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is not None:
+                    continue
+                plan, embeddings = item
+                summary = await run_blocking(self.client.write_documents, plan, embeddings, flush=False)
+                self.progress["inserted"] += summary["inserted"]
+                self.progress["updated"] += summary["updated"]
+                if self.flush_policy.record(len(plan.ids)):
+                    await self._flush()
+            except Exception as e:
+                self._fail(e)
+            finally:
+                insert_queue.task_done()
+
+    async def run(self, lines: AsyncIterator[bytes]) -> Dict[str, Any]:
+        _active_ingestions[self.progress["id"]] = self.progress
+        embed_queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        insert_queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        embedders = [asyncio.create_task(self._embed(embed_queue, insert_queue)) for _ in range(self.concurrency)]
+        inserter = asyncio.create_task(self._insert(insert_queue))
+
+        try:
+            try:
+                await self._parse(lines, embed_queue)
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+            finally:
+                for _ in embedders:
+                    await embed_queue.put(None)
+                await asyncio.gather(*embedders)
+                await insert_queue.put(None)
+                await inserter
+
+            if self._error is not None:
+                raise self._error
+            if self.flush_policy.at_end and self.flush_policy.pending:
+                await self._flush()
+            self.progress["status"] = "completed"
+        except BaseException:
+            self.progress["status"] = "failed"
+            for task in embedders + [inserter]:
+                task.cancel()
+            raise
+        finally:
+            _active_ingestions.pop(self.progress["id"], None)
+
+        self.progress["elapsed_seconds"] = time.time() - self.progress["started_at"]
+        return self.progress
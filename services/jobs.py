@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import socket
+import uuid
+import asyncio
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from utils import agenerate_embeddings, run_blocking
+from services.metrics import REGISTRY, timed
+from database.upsert import content_hash
+
+JOBS = REGISTRY.counter("vector_store_jobs_total", "Background ingestion jobs by final status")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    vector_store TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT,
+    total INTEGER NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL DEFAULT 0,
+    unchanged INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+"""
+
+_COLUMNS = ["id", "vector_store", "collection", "status", "total", "processed", "inserted", "updated",
+            "unchanged", "error", "created_at", "updated_at"]
+
+class JobStore:
+    # Each process claims jobs under its own owner id with a lease it renews while working. Only jobs whose
+    # lease ran out, because their worker died, go back to the queue, so several processes can share one file.
+    def __init__(self, path: str, lease_seconds: float = 60.0, owner: Optional[str] = None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)").fetchall()]
+        if columns and "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _row(self, row) -> Dict[str, Any]:
+        return dict(zip(_COLUMNS, row))
+
+    def enqueue(self, vector_store: str, collection: str, documents: List[str],
+                metadatas: Optional[List[Dict[str, Any]]] = None, ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        payload = json.dumps({"documents": documents, "metadatas": metadatas, "ids": ids})
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, vector_store, collection, status, payload, total, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, vector_store, collection, payload, len(documents), now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, status: Optional[str] = None, collection: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        clauses, args = [], []
+        if status:
+            clauses.append("status = ?")
+            args.append(status)
+        if collection:
+            clauses.append("collection = ?")
+            args.append(collection)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs {where} ORDER BY seq DESC LIMIT ?", (*args, limit)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def _requeue_expired(self, now: float) -> int:
+        return self._conn.execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+            (now, now)
+        ).rowcount
+
+    def requeue_expired(self) -> int:
+        with self._lock:
+            return self._requeue_expired(time.time())
+
+    def heartbeat(self, job_ids: List[str]) -> int:
+        if not job_ids:
+            return 0
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                f"UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = 'running' "
+                f"AND id IN ({', '.join('?' * len(job_ids))})",
+                (now + self.lease_seconds, self.owner, *job_ids)
+            ).rowcount
+
+    def release(self, job_ids: List[str]) -> int:
+        if not job_ids:
+            return 0
+        with self._lock:
+            return self._conn.execute(
+                f"UPDATE jobs SET status = 'queued', owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                f"WHERE owner = ? AND status = 'running' AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), self.owner, *job_ids)
+            ).rowcount
+
+    def claim(self, max_documents: int) -> List[Dict[str, Any]]:
+        # Take the oldest queued job whose collection has nothing running, plus the jobs queued right
+        # behind it for the same collection while they fit in one batch. Jobs of one collection are
+        # therefore always applied in enqueue order.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._requeue_expired(now)
+                head = self._conn.execute(
+                    "SELECT seq, vector_store, collection FROM jobs WHERE status = 'queued' "
+                    "AND (vector_store, collection) NOT IN "
+                    "(SELECT vector_store, collection FROM jobs WHERE status = 'running') "
+                    "ORDER BY seq LIMIT 1"
+                ).fetchone()
+                if head is None:
+                    self._conn.execute("COMMIT")
+                    return []
+
+                rows = self._conn.execute(
+                    "SELECT seq, id, vector_store, collection, payload, total, processed FROM jobs "
+                    "WHERE status = 'queued' AND vector_store = ? AND collection = ? AND seq >= ? ORDER BY seq",
+                    head[1:] + head[:1]
+                ).fetchall()
+                claimed = []
+                documents = 0
+                for seq, job_id, vector_store, collection, payload, total, processed in rows:
+                    if claimed and documents + total - processed > max_documents:
+                        break
+                    claimed.append({
+                        "id": job_id,
+                        "vector_store": vector_store,
+                        "collection": collection,
+                        "payload": json.loads(payload),
+                        "total": total,
+                        "processed": processed
+                    })
+                    documents += total - processed
+
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    [(self.owner, now + self.lease_seconds, now, job["id"]) for job in claimed]
+                )
+                self._conn.execute("COMMIT")
+                return claimed
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def progress(self, job_id: str, processed: int, summary: Dict[str, int]) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET processed = ?, inserted = inserted + ?, updated = updated + ?, "
+                "unchanged = unchanged + ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (processed, summary["inserted"], summary["updated"], summary["unchanged"], time.time(), job_id, self.owner)
+            ).rowcount > 0
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        with self._lock:
+            finished = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = CASE WHEN ? = 'completed' THEN NULL ELSE payload END, "
+                "owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, error, status, time.time(), job_id, self.owner)
+            ).rowcount > 0
+        if finished:
+            JOBS.inc(status=status)
+        return finished
+
+class JobQueue:
+    def __init__(self, client_factory: Callable[[str], Any], path: str = None, workers: int = None,
+                 batch_size: int = None, poll_interval: float = None):
+        self._client_factory = client_factory
+        self._path = path or os.getenv("JOB_QUEUE_PATH") or os.path.join(os.getenv("CHROMA_PATH", "/app/data"), "jobs.sqlite3")
+        self.workers = workers or int(os.getenv("JOB_WORKERS", 2))
+        self.batch_size = batch_size or int(os.getenv("JOB_BATCH_SIZE", 256))
+        self.poll_interval = poll_interval or float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 1.0))
+        self.lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", 60.0))
+        self.store = None
+        self._tasks: List[asyncio.Task] = []
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = None
+
+    async def start(self):
+        if self.store is not None:
+            return
+        self.store = await run_blocking(JobStore, self._path, self.lease_seconds)
+        resumed = await run_blocking(self.store.requeue_expired)
+        if resumed:
+            print(f"Resuming {resumed} interrupted ingestion jobs")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            # Jobs cut short by shutdown go straight back to the queue instead of waiting out their lease.
+            self.store.release(list(self._active))
+            self._active.clear()
+            self.store.close()
+            self.store = None
+
+    async def enqueue(self, vector_store: str, collection: str, documents: List[str],
+                      metadatas: Optional[List[Dict[str, Any]]] = None, ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        job = await run_blocking(self.store.enqueue, vector_store, collection, documents, metadatas, ids)
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def list(self, status: Optional[str] = None, collection: Optional[str] = None, limit: int = 100):
+        return self.store.list(status, collection, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "batch_size": self.batch_size, "owner": self.store.owner,
+                "counts": self.store.counts()}
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await run_blocking(self.store.heartbeat, list(self._active))
+            except Exception as e:
+                print(f"Ingestion job heartbeat failed: {str(e)}")
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            jobs = await run_blocking(self.store.claim, self.batch_size)
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._active.update((job["id"], job) for job in jobs)
+            try:
+                await self._process(jobs)
+            finally:
+                for job in jobs:
+                    self._active.pop(job["id"], None)
+
+    @staticmethod
+    def _slice(job: Dict[str, Any], start: int, end: int):
+        payload = job["payload"]
+        metadatas = payload.get("metadatas")
+        ids = payload.get("ids")
+        return (
+            payload["documents"][start:end],
+            metadatas[start:end] if metadatas else [None] * (end - start),
+            ids[start:end] if ids else None
+        )
+
+    async def _write(self, client, collection: str, documents, metadatas, ids):
+        plan = await run_blocking(
+            client.plan_documents, collection, documents,
+            metadatas if any(m is not None for m in metadatas) else None, ids
+        )
+        embeddings = None
+        if plan.documents:
+            with timed("embed"):
+                embeddings = await agenerate_embeddings(plan.documents)
+        await run_blocking(client.write_documents, plan, embeddings)
+        return plan
+
+    async def _process(self, jobs: List[Dict[str, Any]]):
+        vector_store = jobs[0]["vector_store"]
+        collection = jobs[0]["collection"]
+        try:
+            client = await run_blocking(self._client_factory, vector_store)
+            if not client:
+                raise ValueError(f"{vector_store.capitalize()} client not configured")
+
+            if len(jobs) == 1:
+                # A single large job is written in chunks so progress survives a restart.
+                job = jobs[0]
+                for start in range(job["processed"], job["total"], self.batch_size):
+                    end = min(start + self.batch_size, job["total"])
+                    plan = await self._write(client, collection, *self._slice(job, start, end))
+                    if not await run_blocking(self.store.progress, job["id"], end, plan.summary()):
+                        print(f"Ingestion job {job['id']} lost its lease, leaving it to its new owner")
+                        return
+            else:
+                # Small jobs queued back to back for one collection share one plan, embedding and write.
+                documents, metadatas, ids = [], [], []
+                for job in jobs:
+                    job_documents, job_metadatas, job_ids = self._slice(job, job["processed"], job["total"])
+                    documents.extend(job_documents)
+                    metadatas.extend(job_metadatas)
+                    ids.extend(job_ids or [content_hash(d, m) for d, m in zip(job_documents, job_metadatas)])
+                plan = await self._write(client, collection, documents, metadatas, ids)
+
+                written = dict(zip(plan.indices, plan.ids))
+                offset = 0
+                for job in jobs:
+                    count = job["total"] - job["processed"]
+                    summary = {"inserted": 0, "updated": 0, "unchanged": 0}
+                    for index in range(offset, offset + count):
+                        if index not in written:
+                            summary["unchanged"] += 1
+                        elif written[index] in plan.replaced:
+                            summary["updated"] += 1
+                        else:
+                            summary["inserted"] += 1
+                    await run_blocking(self.store.progress, job["id"], job["total"], summary)
+                    offset += count
+
+            for job in jobs:
+                await run_blocking(self.store.finish, job["id"], "completed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Ingestion job batch for {vector_store}/{collection} failed: {str(e)}")
+            for job in jobs:
+                await run_blocking(self.store.finish, job["id"], "failed", str(e))
@@ -0,0 +1,104 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from services.metrics import count_cache
+from services.shared_cache import SharedTable
+
+class RerankCache:
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self._max_entries = max_entries if max_entries is not None else int(os.getenv("RERANK_CACHE_MAX_ENTRIES", 100000))
+        self._ttl = ttl if ttl is not None else float(os.getenv("RERANK_CACHE_TTL_SECONDS", 3600))
+        self._entries = OrderedDict()
+        shared_path = os.getenv("RERANK_CACHE_SHARED_PATH")
+        # Shared slots hold (score, wall-clock write time) so every process can apply the TTL.
+        self._shared = SharedTable(
+            shared_path, int(os.getenv("RERANK_CACHE_SHARED_SLOTS", 1 << 20)), "float64", width=2
+        ) if shared_path else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(model: str, query: str, doc_id: str, text: str) -> bytes:
+        query_hash = hashlib.blake2b(query.encode("utf-8"), digest_size=16).digest()
+        text_hash = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return hashlib.blake2b(
+            model.encode("utf-8") + b"\0" + query_hash + b"\0" + str(doc_id).encode("utf-8") + b"\0" + text_hash,
+            digest_size=16
+        ).digest()
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[float]]:
+        now = time.monotonic()
+        scores = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self._ttl and now - entry[1] > self._ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None and self._shared is not None:
+                    entry = self._get_shared(key, now)
+                if entry is None:
+                    self.misses += 1
+                    scores.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    scores.append(entry[0])
+            self._trim()
+        hits = sum(score is not None for score in scores)
+        count_cache("rerank", True, hits)
+        count_cache("rerank", False, len(scores) - hits)
+        return scores
+
+    def _get_shared(self, key: bytes, now: float):
+        value = self._shared.get(key)
+        if value is None:
+            return None
+        age = time.time() - value[1]
+        if self._ttl and age > self._ttl:
+            return None
+        self.shared_hits += 1
+        # Keep the shared entry's age so the local copy expires when the shared one does.
+        entry = (float(value[0]), now - max(age, 0.0))
+        self._entries[key] = entry
+        return entry
+
+    def put_many(self, keys: List[bytes], scores: List[float]):
+        now = time.monotonic()
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._entries[key] = (score, now)
+                self._entries.move_to_end(key)
+                if self._shared is not None:
+                    self._shared.put(key, np.array([score, time.time()], dtype=np.float64))
+            self._trim()
+
+    def _trim(self):
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "ttl_seconds": self._ttl,
+                "shared": self._shared.stats() if self._shared is not None else None
+            }
@@ -1,7 +1,6 @@
 import os
 # from sentence_transformers import CrossEncoder
-import json
-from together import Together
+from services.scheduler import UpstreamScheduler
 class Reranker:
     _instance = None
     
@@ -10,6 +9,11 @@ class Reranker:
             cls._instance = super(Reranker, cls).__new__(cls)
             cls._instance._model = None
             cls._instance._model_name = model_name or os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
+            cls._instance._api_model = os.getenv("RERANKER_API_MODEL", "Salesforce/Llama-Rank-V1")
+            cls._instance._base_url = os.getenv("RERANKER_BASE_URL")
+            cls._instance._client = None
+            cls._instance._async_client = None
+            cls._instance._scheduler = UpstreamScheduler("rerank", "RERANK", default_max_concurrency=8)
         return cls._instance
     
     # def get_model(self):
@@ -29,31 +33,91 @@ class Reranker:
     #     print("reranked indicies: ",reranked_indices)
     #     return reranked_indices 
 
-    def rerank(self,query,documents):
-        client = Together(
-            api_key=os.getenv("TOGETHER_API_KEY")
+    def _get_client(self):
+        if self._client is None:
+            from together import Together
+            self._client = Together(
+                api_key=os.getenv("TOGETHER_API_KEY"),
+                base_url=self._base_url,
+                timeout=self._scheduler.timeout,
+                max_retries=0
+            )
+        return self._client
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            from together import AsyncTogether
+            self._async_client = AsyncTogether(
+                api_key=os.getenv("TOGETHER_API_KEY"),
+                base_url=self._base_url,
+                timeout=self._scheduler.timeout,
+                max_retries=0
+            )
+        return self._async_client
+
+    @staticmethod
+    def document_text(doc):
+        if isinstance(doc, str):
+            return doc
+        return doc.get("text") or (doc.get("metadata") or {}).get("text", "")
+
+    @property
+    def model(self):
+        return self._api_model
+
+    @property
+    def max_concurrency(self):
+        return self._scheduler.limiter.maximum
+
+    def scheduler_stats(self):
+        return self._scheduler.stats()
+
+    @staticmethod
+    def estimate_tokens(query, texts):
+        return (len(query) // 4 + 1) * len(texts) + sum(len(text) // 4 + 1 for text in texts)
+
+    def _scores(self, documents, response):
+        scores = [0.0] * len(documents)
+        for result in response.results:
+            scores[result.index] = result.relevance_score
+        return scores
+
+    def score(self, query, texts):
+        client = self._get_client()
+
+        response = self._scheduler.call(
+            lambda: client.rerank.create(
+                model=self._api_model,
+                query=query,
+                documents=texts,
+                return_documents=False
+            ),
+            tokens=self.estimate_tokens(query, texts)
         )
-        rerank_docs = []
-        for doc in documents:
-            new_doc = {
-                "id": doc["id"],
-                "text": doc["metadata"].get("text", ""), 
-                "metadata": doc["metadata"],
-            }
-            rerank_docs.append(new_doc)
-
-        response = client.rerank.create(
-            model="Salesforce/Llama-Rank-V1",
-            query=query,
-            documents=rerank_docs,
-            return_documents=True,
-            rank_fields=["text"]
+
+        return self._scores(texts, response)
+
+    async def ascore(self, query, texts):
+        client = self._get_async_client()
+
+        response = await self._scheduler.acall(
+            lambda: client.rerank.create(
+                model=self._api_model,
+                query=query,
+                documents=texts,
+                return_documents=False
+            ),
+            tokens=self.estimate_tokens(query, texts)
         )
 
-        scores = {}
-        for result in response.results:
-            doc_id = json.loads(result.document["text"])["id"]
-            scores[doc_id] = result.relevance_score
+        return self._scores(texts, response)
+
+    def rerank(self, query, documents):
+        scores = self.score(query, [self.document_text(doc) for doc in documents])
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [documents[i] for i in order]
 
-        sorted_document = sorted(documents, key=lambda x: scores[x["id"]], reverse=True)
-        return sorted_document
\ No newline at end of file
+    async def arerank(self, query, documents):
+        scores = await self.ascore(query, [self.document_text(doc) for doc in documents])
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [documents[i] for i in order]
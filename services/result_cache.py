@@ -0,0 +1,176 @@
+import os
+import copy
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from services.metrics import count_cache
+from services.shared_cache import SharedTable
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split())
+
+class QueryResultCache:
+    def __init__(self, max_entries: int = None, ttl: float = None, similarity: float = None,
+                 semantic_max_entries: int = None):
+        self._max_entries = max_entries if max_entries is not None else int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000))
+        self._ttl = ttl if ttl is not None else float(os.getenv("RESULT_CACHE_TTL_SECONDS", 300))
+        self._similarity = similarity if similarity is not None else float(os.getenv("RESULT_CACHE_SIMILARITY", 0))
+        self._semantic_max_entries = semantic_max_entries if semantic_max_entries is not None else int(os.getenv("RESULT_CACHE_SEMANTIC_MAX_ENTRIES", 1024))
+        self._generations: Dict[Tuple[str, str], int] = {}
+        shared_path = os.getenv("RESULT_CACHE_SHARED_PATH")
+        self._shared = SharedTable(
+            shared_path, int(os.getenv("RESULT_CACHE_SHARED_SLOTS", 4096)), "int64", width=1
+        ) if shared_path else None
+        single_worker = os.getenv("RESULT_CACHE_SINGLE_WORKER", "false").lower() == "true"
+        if self._shared is None and not single_worker and self._max_entries > 0:
+            # The worker count can't be detected reliably (uvicorn --workers sets no environment), and without a
+            # shared generation table a worker would keep serving results another worker invalidated.
+            print("Query result cache disabled: set RESULT_CACHE_SHARED_PATH, or RESULT_CACHE_SINGLE_WORKER=true for one worker")
+            self._max_entries = 0
+        self._exact = OrderedDict()
+        self._semantic: Dict[Tuple[str, str, bytes], OrderedDict] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0
+
+    @staticmethod
+    def _generation_key(vector_store: str, collection_name: str) -> bytes:
+        return hashlib.blake2b(f"{vector_store}\0{collection_name}".encode("utf-8"), digest_size=16).digest()
+
+    def generation(self, vector_store: str, collection_name: str) -> int:
+        if self._shared is not None:
+            value = self._shared.get(self._generation_key(vector_store, collection_name))
+            return int(value[0]) if value is not None else 0
+        return self._generations.get((vector_store, collection_name), 0)
+
+    def bump(self, vector_store: str, collection_name: str):
+        with self._lock:
+            key = (vector_store, collection_name)
+            if self._shared is not None:
+                # A random generation rather than an increment, so concurrent bumps from two workers can never
+                # land on the same value and both of them invalidate.
+                self._shared.put(self._generation_key(*key), np.array([uuid.uuid4().int >> 65], dtype=np.int64))
+            else:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            for semantic_key in [k for k in self._semantic if k[:2] == key]:
+                del self._semantic[semantic_key]
+            self.invalidations += 1
+
+    @staticmethod
+    def _params_hash(params: Dict[str, Any]) -> bytes:
+        return hashlib.blake2b(json.dumps(params, sort_keys=True, default=str).encode("utf-8"), digest_size=16).digest()
+
+    def _exact_key(self, vector_store: str, collection_name: str, query_texts: List[str], params: Dict[str, Any]) -> bytes:
+        return self._params_hash({
+            "vector_store": vector_store,
+            "collection": collection_name,
+            "queries": [normalize_query(text) for text in query_texts],
+            "params": params
+        })
+
+    def _valid(self, entry, generation: int, now: float) -> bool:
+        return entry["generation"] == generation and (not self._ttl or now - entry["created"] <= self._ttl)
+
+    def get(self, vector_store: str, collection_name: str, query_texts: List[str], params: Dict[str, Any]):
+        if not self.enabled:
+            return None
+        key = self._exact_key(vector_store, collection_name, query_texts, params)
+        generation = self.generation(vector_store, collection_name)
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is not None and self._valid(entry, generation, time.monotonic()):
+                self._exact.move_to_end(key)
+                self.hits += 1
+                count_cache("query_result", True)
+                return copy.deepcopy(entry["results"])
+            if entry is not None:
+                del self._exact[key]
+        return None
+
+    def get_similar(self, vector_store: str, collection_name: str, query_embeddings: List[List[float]],
+                    params: Dict[str, Any]):
+        if not self.enabled or not self._similarity or len(query_embeddings) != 1:
+            self._miss()
+            return None
+
+        bucket_key = (vector_store, collection_name, self._params_hash(params))
+        generation = self.generation(vector_store, collection_name)
+        query = np.asarray(query_embeddings[0], dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            self._miss()
+            return None
+        query /= norm
+
+        with self._lock:
+            bucket = self._semantic.get(bucket_key)
+            if bucket:
+                now = time.monotonic()
+                entries = [(key, entry) for key, entry in bucket.items() if self._valid(entry, generation, now)]
+                if entries:
+                    matrix = np.stack([entry["embedding"] for _, entry in entries])
+                    similarities = matrix @ query
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self._similarity:
+                        key, entry = entries[best]
+                        bucket.move_to_end(key)
+                        self.semantic_hits += 1
+                        count_cache("query_result_semantic", True)
+                        return copy.deepcopy(entry["results"])
+        self._miss()
+        return None
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        count_cache("query_result", False)
+
+    def put(self, vector_store: str, collection_name: str, query_texts: List[str], params: Dict[str, Any],
+            results: Any, generation: int, query_embeddings: Optional[List[List[float]]] = None):
+        if not self.enabled:
+            return
+        key = self._exact_key(vector_store, collection_name, query_texts, params)
+        entry = {"generation": generation, "created": time.monotonic(), "results": copy.deepcopy(results)}
+        with self._lock:
+            if generation != self.generation(vector_store, collection_name):
+                return
+            self._exact[key] = entry
+            self._exact.move_to_end(key)
+            while len(self._exact) > self._max_entries:
+                self._exact.popitem(last=False)
+
+            if self._similarity and query_embeddings is not None and len(query_embeddings) == 1:
+                embedding = np.asarray(query_embeddings[0], dtype=np.float32)
+                norm = np.linalg.norm(embedding)
+                if norm:
+                    bucket = self._semantic.setdefault((vector_store, collection_name, self._params_hash(params)), OrderedDict())
+                    bucket[key] = dict(entry, embedding=embedding / norm)
+                    while len(bucket) > self._semantic_max_entries:
+                        bucket.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._exact),
+                "semantic_entries": sum(len(bucket) for bucket in self._semantic.values()),
+                "max_entries": self._max_entries,
+                "similarity_threshold": self._similarity,
+                "shared_generations": self._shared.stats() if self._shared is not None else None
+            }
@@ -0,0 +1,243 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from services.metrics import REGISTRY, upstream_call
+
+UPSTREAM_RETRIES = REGISTRY.counter("vector_store_upstream_retries_total", "Retried upstream calls by provider and reason")
+UPSTREAM_HEDGES = REGISTRY.counter("vector_store_upstream_hedges_total", "Hedged upstream calls by provider and winner")
+UPSTREAM_CONCURRENCY = REGISTRY.gauge("vector_store_upstream_concurrency_limit", "Current adaptive concurrency limit per provider")
+
+def _env(prefix: str, name: str, default, cast=float):
+    value = os.getenv(f"{prefix}_{name}")
+    return cast(value) if value not in (None, "") else default
+
+def classify_error(error: BaseException) -> Optional[str]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return "throttled"
+    if status is not None:
+        return "server_error" if status >= 500 else None
+    name = type(error).__name__
+    if "Timeout" in name or isinstance(error, TimeoutError):
+        return "timeout"
+    if "Connection" in name or isinstance(error, ConnectionError):
+        return "connection"
+    return None
+
+def retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, amount: float = 1.0):
+        delay = self._reserve(amount)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, amount: float = 1.0):
+        delay = self._reserve(amount)
+        if delay:
+            await asyncio.sleep(delay)
+
+class AIMDLimiter:
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float = 0.0,
+                 decrease_factor: float = 0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self._last_decrease = 0.0
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                event = asyncio.Event()
+                self._async_waiters.append((loop, event))
+            await event.wait()
+
+    def _wake(self):
+        self._condition.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            slow = latency is not None and self.latency_target and latency > self.latency_target
+            if overloaded or slow:
+                # Back off at most once per latency window so one burst of failures does not collapse the limit.
+                if now - self._last_decrease >= (self.latency_target or 0.1):
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._wake()
+
+class UpstreamScheduler:
+    def __init__(self, provider: str, prefix: str, default_max_concurrency: int = 8):
+        self.provider = provider
+        self.requests = TokenBucket(_env(prefix, "RATE_LIMIT_RPS", 0.0), _env(prefix, "RATE_LIMIT_BURST", None))
+        self.tokens = TokenBucket(_env(prefix, "RATE_LIMIT_TPS", 0.0), _env(prefix, "RATE_LIMIT_TOKEN_BURST", None))
+        maximum = _env(prefix, "MAX_CONCURRENCY", default_max_concurrency, int)
+        self.limiter = AIMDLimiter(
+            initial=_env(prefix, "INITIAL_CONCURRENCY", maximum, int),
+            minimum=_env(prefix, "MIN_CONCURRENCY", 1, int),
+            maximum=maximum,
+            latency_target=_env(prefix, "LATENCY_TARGET_MS", 0.0) / 1000
+        )
+        self.max_retries = _env(prefix, "MAX_RETRIES", 3, int)
+        self.backoff_base = _env(prefix, "BACKOFF_BASE_MS", 100.0) / 1000
+        self.backoff_max = _env(prefix, "BACKOFF_MAX_MS", 10000.0) / 1000
+        self.hedge_after = _env(prefix, "HEDGE_AFTER_MS", 0.0) / 1000
+        self.timeout = _env(prefix, "TIMEOUT_SECONDS", 30.0)
+        UPSTREAM_CONCURRENCY.set(self.limiter.limit, provider=provider)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        hinted = retry_after(error)
+        return max(delay, hinted) if hinted is not None else delay
+
+    def _should_retry(self, attempt: int, error: BaseException) -> Optional[str]:
+        reason = classify_error(error)
+        if reason is None or attempt >= self.max_retries:
+            return None
+        UPSTREAM_RETRIES.inc(provider=self.provider, reason=reason)
+        return reason
+
+    def _finish(self, start: float, error: Optional[BaseException] = None):
+        overloaded = error is not None and classify_error(error) in ("throttled", "timeout")
+        self.limiter.release(None if error is not None else time.monotonic() - start, overloaded)
+        UPSTREAM_CONCURRENCY.set(self.limiter.limit, provider=self.provider)
+
+    def _attempt(self, fn: Callable[[], Any]) -> Any:
+        self.limiter.acquire()
+        start = time.monotonic()
+        try:
+            with upstream_call(self.provider):
+                result = fn()
+        except BaseException as e:
+            self._finish(start, e)
+            raise
+        self._finish(start)
+        return result
+
+    async def _aattempt(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        await self.limiter.aacquire()
+        start = time.monotonic()
+        try:
+            with upstream_call(self.provider):
+                result = await fn()
+        except BaseException as e:
+            self._finish(start, e)
+            raise
+        self._finish(start)
+        return result
+
+    async def _ahedged(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.hedge_after:
+            return await self._aattempt(fn)
+
+        primary = asyncio.ensure_future(self._aattempt(fn))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(self._aattempt(fn))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        UPSTREAM_HEDGES.inc(provider=self.provider, winner="hedge" if task is hedge else "primary")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        attempt = 0
+        while True:
+            self.requests.acquire()
+            self.tokens.acquire(tokens)
+            try:
+                return self._attempt(fn)
+            except Exception as e:
+                if self._should_retry(attempt, e) is None:
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        attempt = 0
+        while True:
+            await self.requests.aacquire()
+            await self.tokens.aacquire(tokens)
+            try:
+                return await self._ahedged(fn)
+            except Exception as e:
+                if self._should_retry(attempt, e) is None:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                attempt += 1
+
+    def stats(self):
+        return {
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "requests_per_second": self.requests.rate,
+            "tokens_per_second": self.tokens.rate,
+            "max_retries": self.max_retries,
+            "hedge_after_seconds": self.hedge_after
+        }
@@ -0,0 +1,164 @@
+import os
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Optional
+import numpy as np
+
+_MAGIC = b"VSSHM001"
+_HEADER = np.dtype([("magic", "S8"), ("slots", "<u8"), ("width", "<u8"), ("dtype", "S8")])
+_HEADER_BYTES = 64
+_PROBE = 8
+
+class SharedTable:
+    # An open-addressing hash table of fixed-width slots in a memory-mapped file (put it on /dev/shm to keep
+    # it in RAM). Every process on the host maps the same pages. Writers serialize on a flock; readers take
+    # no lock and use a per-slot sequence number (odd while a write is in progress) to detect torn reads.
+    def __init__(self, path: str, slots: int, dtype: str = "float32", width: Optional[int] = None):
+        self.path = path
+        self.slots = 1 << max(int(slots) - 1, 1).bit_length()
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.width = width
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._mmap = None
+        self._last_attach = 0.0
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not self._attach() and width is not None:
+            # With the width known up front the table exists from the start, so no worker misses early writes.
+            self._create(width)
+
+    def _record_dtype(self, width: int) -> np.dtype:
+        value_bytes = self.dtype.itemsize * width
+        itemsize = 24 + (value_bytes + 7) // 8 * 8
+        return np.dtype({
+            "names": ["seq", "key", "value"],
+            "formats": ["<u8", "V16", (self.dtype, (width,))],
+            "offsets": [0, 8, 24],
+            "itemsize": itemsize
+        })
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if self._lock_file is None:
+                self._lock_file = open(self.path + ".lock", "a+b")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _map(self, slots: int, width: int):
+        records = np.memmap(self.path, dtype=self._record_dtype(width), mode="r+", offset=_HEADER_BYTES, shape=(slots,))
+        self.slots = slots
+        self.width = width
+        self._seq = records["seq"]
+        self._keys = records["key"]
+        self._values = records["value"]
+        self._mmap = records
+
+    def _attach(self) -> bool:
+        # Maps a table another process already created. The first writer creates it once the width is known.
+        if self._mmap is not None:
+            return True
+        self._last_attach = time.monotonic()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < _HEADER_BYTES:
+            return False
+        header = np.fromfile(self.path, dtype=_HEADER, count=1)[0]
+        if header["magic"] != _MAGIC:
+            raise ValueError(f"{self.path} is not a shared cache table")
+        if np.dtype(header["dtype"].decode()) != self.dtype:
+            raise ValueError(f"Shared cache at {self.path} uses {header['dtype'].decode()}, not {self.dtype.str}")
+        if self.width is not None and int(header["width"]) != self.width:
+            raise ValueError(f"Shared cache at {self.path} holds width {int(header['width'])}, not {self.width}")
+        slots, width = int(header["slots"]), int(header["width"])
+        if os.path.getsize(self.path) < _HEADER_BYTES + slots * self._record_dtype(width).itemsize:
+            return False
+        self._map(slots, width)
+        return True
+
+    def _create(self, width: int):
+        with self._write_lock():
+            if self._attach():
+                return
+            record_bytes = self._record_dtype(width).itemsize
+            with open(self.path, "wb") as f:
+                header = np.zeros(1, dtype=_HEADER)
+                header[0] = (_MAGIC, self.slots, width, self.dtype.str.encode())
+                f.write(header.tobytes().ljust(_HEADER_BYTES, b"\0"))
+                f.truncate(_HEADER_BYTES + self.slots * record_bytes)
+            self._map(self.slots, width)
+
+    def _ready(self) -> bool:
+        if self._mmap is not None:
+            return True
+        if time.monotonic() - self._last_attach < 1.0:
+            return False
+        return self._attach()
+
+    def _start(self, key: bytes) -> int:
+        return int.from_bytes(key[:8], "little") & (self.slots - 1)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        if not self._ready():
+            return None
+        start = self._start(key)
+        for i in range(_PROBE):
+            slot = (start + i) & (self.slots - 1)
+            seq = int(self._seq[slot])
+            if seq == 0:
+                return None
+            if seq & 1 or self._keys[slot].tobytes() != key:
+                continue
+            value = np.array(self._values[slot])
+            if int(self._seq[slot]) == seq:
+                return value
+        return None
+
+    def put(self, key: bytes, value: np.ndarray):
+        value = np.asarray(value).reshape(-1)
+        if not self._ready():
+            self._create(len(value))
+        if len(value) != self.width:
+            return
+
+        start = self._start(key)
+        with self._write_lock():
+            target = None
+            for i in range(_PROBE):
+                slot = (start + i) & (self.slots - 1)
+                if self._seq[slot] == 0 or self._keys[slot].tobytes() == key:
+                    target = slot
+                    break
+            if target is None:
+                # A full probe window overwrites one of its slots, picked by the key so writers spread out.
+                target = (start + key[8] % _PROBE) & (self.slots - 1)
+                self.evictions += 1
+            seq = int(self._seq[target])
+            self._seq[target] = seq + 1
+            self._keys[target] = np.void(key)
+            self._values[target] = value
+            self._seq[target] = seq + 2
+
+    def stats(self):
+        if not self._ready():
+            return {"path": self.path, "slots": self.slots, "entries": 0, "bytes": 0, "evictions": self.evictions}
+        return {
+            "path": self.path,
+            "slots": self.slots,
+            "entries": int(np.count_nonzero(self._seq)),
+            "bytes": _HEADER_BYTES + self._mmap.nbytes,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        self._mmap = None
+        self._seq = self._keys = self._values = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
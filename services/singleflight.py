@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+from services.metrics import REGISTRY
+
+COALESCED_CALLS = REGISTRY.counter("vector_store_singleflight_total", "Calls by single-flight group and role (leader or follower)")
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, keys: List[Hashable]) -> Tuple[List[Hashable], Dict[Hashable, Future]]:
+        owned = []
+        waiting = {}
+        with self._lock:
+            for key in keys:
+                future = self._calls.get(key)
+                if future is not None:
+                    waiting[key] = future
+                elif key not in owned:
+                    self._calls[key] = Future()
+                    owned.append(key)
+        if owned:
+            COALESCED_CALLS.inc(len(owned), group=self.name, role="leader")
+        if waiting:
+            COALESCED_CALLS.inc(len(waiting), group=self.name, role="follower")
+        return owned, waiting
+
+    def resolve(self, keys: List[Hashable], values: List[Any]):
+        with self._lock:
+            futures = [self._calls.pop(key, None) for key in keys]
+        for future, value in zip(futures, values):
+            if future is not None and not future.done():
+                future.set_result(value)
+
+    def fail(self, keys: List[Hashable], error: Exception):
+        with self._lock:
+            futures = [self._calls.pop(key, None) for key in keys]
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def abandon(self, keys: List[Hashable]):
+        # A cancelled leader releases its keys instead of failing them, so followers run the call themselves
+        # rather than inheriting a cancellation that was never theirs.
+        with self._lock:
+            futures = [self._calls.pop(key, None) for key in keys]
+        for future in futures:
+            if future is not None:
+                future.cancel()
+
+    def wait(self, waiting: Dict[Hashable, Future]) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        resolved = {}
+        abandoned = []
+        for key, future in waiting.items():
+            try:
+                resolved[key] = future.result()
+            except CancelledError:
+                abandoned.append(key)
+        return resolved, abandoned
+
+    async def await_all(self, waiting: Dict[Hashable, Future]) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        resolved = {}
+        abandoned = []
+        for key, future in waiting.items():
+            try:
+                resolved[key] = await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                abandoned.append(key)
+        return resolved, abandoned
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            owned, waiting = self.claim([key])
+            if owned:
+                break
+            resolved, _ = self.wait(waiting)
+            if key in resolved:
+                return resolved[key]
+        try:
+            value = fn()
+        except Exception as e:
+            self.fail(owned, e)
+            raise
+        except BaseException:
+            self.abandon(owned)
+            raise
+        self.resolve(owned, [value])
+        return value
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            owned, waiting = self.claim([key])
+            if owned:
+                break
+            resolved, _ = await self.await_all(waiting)
+            if key in resolved:
+                return resolved[key]
+        try:
+            value = await fn()
+        except Exception as e:
+            self.fail(owned, e)
+            raise
+        except BaseException:
+            self.abandon(owned)
+            raise
+        self.resolve(owned, [value])
+        return value
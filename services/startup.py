@@ -0,0 +1,83 @@
+import os
+import time
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+from services.metrics import REGISTRY
+
+STARTUP_SECONDS = REGISTRY.gauge("vector_store_startup_seconds", "Startup phase durations")
+
+class StartupReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.warmup: Dict[str, Any] = {}
+        self.first_query: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def mark(self, phase: str, seconds: float):
+        self.phases[phase] = seconds
+        STARTUP_SECONDS.set(seconds, phase=phase)
+
+    def record_query(self):
+        if self.first_query is None:
+            self.first_query = self.elapsed()
+            STARTUP_SECONDS.set(self.first_query, phase="first_query")
+            print(f"First successful query {self.first_query:.3f}s after startup")
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "phases": dict(self.phases),
+            "warmup": dict(self.warmup),
+            "first_query_seconds": self.first_query
+        }
+
+startup_report = StartupReport()
+
+def _csv(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+async def warmup(client_factory: Callable[[str], Any]):
+    # Imported here so that the startup clock in this module starts before the rest of the app loads.
+    from utils import run_blocking
+    from services.embedder import Embedder
+
+    stores = _csv(os.getenv("WARMUP_VECTOR_STORES", ""))
+    embedding_requests = int(os.getenv("WARMUP_EMBEDDING_REQUESTS", 1))
+    queries = _csv(os.getenv("WARMUP_QUERIES", ""))
+
+    for vector_store in stores:
+        start = time.perf_counter()
+        try:
+            client = await run_blocking(client_factory, vector_store)
+            if client is None:
+                raise ValueError("client not configured")
+            await run_blocking(client.ping)
+            startup_report.warmup[f"connect_{vector_store}"] = time.perf_counter() - start
+        except Exception as e:
+            startup_report.warmup[f"connect_{vector_store}"] = f"failed: {str(e)}"
+            print(f"Warmup could not open {vector_store}: {str(e)}")
+
+    if embedding_requests > 0:
+        # Calls go straight to the async client, past the cache and the micro-batcher, so the concurrent
+        # requests each open a connection in the pool that batched requests use later.
+        start = time.perf_counter()
+        try:
+            embedder = Embedder()
+            await asyncio.gather(*(embedder.agenerate_embeddings([f"warmup {i}"]) for i in range(embedding_requests)))
+            startup_report.warmup["embedding"] = time.perf_counter() - start
+        except Exception as e:
+            startup_report.warmup["embedding"] = f"failed: {str(e)}"
+            print(f"Warmup embedding call failed: {str(e)}")
+
+    for entry in queries:
+        vector_store, _, collection_name = entry.partition(":")
+        start = time.perf_counter()
+        try:
+            client = await run_blocking(client_factory, vector_store)
+            await run_blocking(client.query, collection_name=collection_name, query_texts=["warmup"], n_results=1)
+            startup_report.warmup[f"query_{vector_store}_{collection_name}"] = time.perf_counter() - start
+        except Exception as e:
+            startup_report.warmup[f"query_{vector_store}_{collection_name}"] = f"failed: {str(e)}"
+            print(f"Warmup query on {entry} failed: {str(e)}")
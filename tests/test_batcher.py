@@ -0,0 +1,44 @@
+import time
+import threading
+from services.batcher import MicroBatcher
+
+def test_batches_run_concurrently_up_to_limit():
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def embed(items):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(embed, max_batch_size=2, max_wait_ms=1, max_concurrency=3)
+    try:
+        futures = [batcher.submit(i) for i in range(12)]
+        assert [future.result(timeout=5) for future in futures] == [i * 2 for i in range(12)]
+    finally:
+        batcher.close()
+    assert 1 < peak[0] <= 3
+
+def test_batch_error_fails_only_its_callers():
+    def embed(items):
+        if "bad" in items:
+            raise ValueError("boom")
+        return items
+
+    batcher = MicroBatcher(embed, max_batch_size=1, max_wait_ms=0)
+    try:
+        bad = batcher.submit("bad")
+        good = batcher.submit("good")
+        assert good.result(timeout=5) == "good"
+        try:
+            bad.result(timeout=5)
+            assert False, "expected the batch error"
+        except ValueError:
+            pass
+    finally:
+        batcher.close()
@@ -0,0 +1,13 @@
+from database.chroma_client import ChromaClient
+
+def test_readding_without_metadata_is_unchanged(tmp_path):
+    client = ChromaClient(str(tmp_path))
+    client.create_collection("docs")
+
+    assert client.add_documents("docs", ["alpha beta"], [{"k": 1}], ["a"], [[1.0, 0.0]])["inserted"] == 1
+    assert client.add_documents("docs", ["alpha beta 2"], None, ["a"], [[0.0, 1.0]])["updated"] == 1
+    assert client.add_documents("docs", ["alpha beta 2"], None, ["a"], [[0.0, 1.0]]) == {"inserted": 0, "updated": 0, "unchanged": 1}
+
+    results = client.query("docs", ["q"], n_results=1, query_embeddings=[[0.0, 1.0]])
+    assert results["metadatas"] == [[None]]
+    assert client.peek("docs")["metadatas"] == [None]
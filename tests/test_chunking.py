@@ -0,0 +1,42 @@
+import pytest
+from services.chunking import Chunker, chunk_text, collapse_results, estimate_tokens
+
+def test_chunks_respect_the_token_budget_and_overlap():
+    text = " ".join(f"word{i}" for i in range(200))
+    chunks = chunk_text(text, 20, 4)
+    assert all(sum(estimate_tokens(piece) for piece in chunk.split()) <= 20 for _, _, chunk in chunks)
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(text)
+    assert all(later[0] < earlier[1] for earlier, later in zip(chunks, chunks[1:]))
+
+@pytest.mark.parametrize("text", ["字" * 8500, "x" * 200000])
+def test_text_without_whitespace_is_split_by_characters(text):
+    chunks = chunk_text(text, 512, 64)
+    assert len(chunks) > 1
+    assert max(len(chunk) for _, _, chunk in chunks) <= 512 * 4
+    assert "".join(chunk for _, _, chunk in chunks) == text
+
+def test_long_run_after_short_words_does_not_stall_on_overlap():
+    chunks = chunk_text("a " * 10 + "y" * 5000 + " tail", 512, 64)
+    assert len(chunks) == 4
+
+def test_split_assigns_parent_ids_and_positions():
+    documents, metadatas, ids = Chunker(10, 2).split([" ".join(["w"] * 25), "short"], [{"k": 1}, None], ["A", "B"])
+    assert ids == ["A#0", "A#1", "A#2", "B#0"]
+    assert metadatas[0] == {"k": 1, "parent_id": "A", "chunk_index": 0, "chunk_count": 3, "chunk_start": 0, "chunk_end": 20}
+    assert metadatas[-1]["chunk_count"] == 1
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        Chunker(4, 4)
+
+def test_collapse_keeps_best_chunk_per_parent():
+    results = {
+        "ids": [["A#1", "A#0", "B#0"]],
+        "distances": [[0.1, 0.2, 0.3]],
+        "metadatas": [[{"parent_id": "A"}, {"parent_id": "A"}, {"parent_id": "B"}]],
+        "documents": [["a1", "a0", "b0"]]
+    }
+    collapsed = collapse_results(results, 2)
+    assert collapsed["ids"] == [["A", "B"]]
+    assert collapsed["documents"] == [["a1", "b0"]]
+    assert collapsed["chunk_ids"] == [[["A#1", "A#0"], ["B#0"]]]
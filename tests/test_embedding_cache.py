@@ -0,0 +1,35 @@
+import multiprocessing
+import numpy as np
+from services.embedding_cache import DiskEmbeddingStore
+
+def key(worker: int, n: int) -> bytes:
+    return bytes([worker]) + n.to_bytes(15, "little")
+
+def fill(path: str, worker: int):
+    store = DiskEmbeddingStore(path)
+    for n in range(200):
+        store.put(key(worker, n), np.full(8, worker * 1000 + n, dtype=np.float32))
+    store.close()
+
+def test_workers_sharing_a_path_never_overwrite_each_other(tmp_path):
+    path = str(tmp_path / "cache")
+    DiskEmbeddingStore(path).close()
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=fill, args=(path, worker)) for worker in (1, 2, 3)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    store = DiskEmbeddingStore(path)
+    assert len(store) == 600
+    for worker in (1, 2, 3):
+        for n in range(200):
+            assert store.get(key(worker, n))[0] == worker * 1000 + n
+
+def test_entries_written_by_another_store_are_found(tmp_path):
+    path = str(tmp_path / "cache")
+    reader, writer = DiskEmbeddingStore(path), DiskEmbeddingStore(path)
+    writer.put(key(1, 1), np.ones(4, dtype=np.float32))
+    assert reader.get(key(1, 1)).tolist() == [1, 1, 1, 1]
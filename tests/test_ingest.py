@@ -0,0 +1,35 @@
+import json
+import asyncio
+from services import ingest
+from services.ingest import IngestPipeline
+from database.upsert import UpsertPlan, content_hash
+
+class RecordingClient:
+    def __init__(self):
+        self.ids = []
+
+    def plan_documents(self, collection_name, documents, metadatas=None, ids=None):
+        self.ids.extend(ids)
+        return UpsertPlan(collection_name, documents, metadatas, ids).resolve({}, {})
+
+    def write_documents(self, plan, embeddings, flush=True):
+        return plan.summary()
+
+    def flush(self, collection_name):
+        pass
+
+async def fake_embeddings(documents):
+    return [[0.0] for _ in documents]
+
+def test_mixed_batch_keeps_supplied_ids(monkeypatch):
+    monkeypatch.setattr(ingest, "agenerate_embeddings", fake_embeddings)
+    records = [{"document": "a", "id": "keep-me"}, {"document": "b", "metadata": {"k": 1}}]
+    body = "\n".join(json.dumps(record) for record in records).encode()
+
+    async def lines():
+        yield body
+
+    client = RecordingClient()
+    progress = asyncio.run(IngestPipeline(client, "docs", batch_size=8, concurrency=1).run(lines()))
+    assert client.ids == ["keep-me", content_hash("b", {"k": 1})]
+    assert progress["inserted"] == 2
@@ -0,0 +1,34 @@
+import time
+from services.jobs import JobStore
+
+def test_live_lease_is_not_taken_by_another_process(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = JobStore(path, lease_seconds=60), JobStore(path, lease_seconds=60)
+    job = first.enqueue("local", "docs", ["a"])
+    assert [claimed["id"] for claimed in first.claim(10)] == [job["id"]]
+
+    assert second.requeue_expired() == 0
+    assert second.claim(10) == []
+    assert first.heartbeat([job["id"]]) == 1
+    assert first.finish(job["id"], "completed")
+    assert first.get(job["id"])["status"] == "completed"
+
+def test_expired_lease_is_requeued_and_old_owner_is_fenced(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = JobStore(path, lease_seconds=0.05), JobStore(path, lease_seconds=60)
+    job = first.enqueue("local", "docs", ["a", "b"])
+    first.claim(10)
+    time.sleep(0.1)
+
+    assert [claimed["id"] for claimed in second.claim(10)] == [job["id"]]
+    assert not first.progress(job["id"], 1, {"inserted": 1, "updated": 0, "unchanged": 0})
+    assert not first.finish(job["id"], "completed")
+    assert second.finish(job["id"], "completed")
+
+def test_released_jobs_are_claimable_at_once(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = JobStore(path), JobStore(path)
+    job = first.enqueue("local", "docs", ["a"])
+    first.claim(10)
+    assert first.release([job["id"]]) == 1
+    assert [claimed["id"] for claimed in second.claim(10)] == [job["id"]]
@@ -0,0 +1,42 @@
+import time
+from database import local_client
+from database.local_client import LocalClient
+from services.chunking import Chunker
+
+def add(client, chunker, document):
+    documents, metadatas, ids = chunker.split([document], None, ["doc1"])
+    plan = client.plan_documents("docs", documents, metadatas, ids)
+    return client.write_documents(plan, [[float(len(text)), 1.0] for text in plan.documents])
+
+def test_rechunked_document_drops_trailing_chunks(tmp_path):
+    client = LocalClient(str(tmp_path))
+    client.create_collection("docs")
+    chunker = Chunker(20, 4)
+
+    add(client, chunker, " ".join(f"word{i}" for i in range(300)))
+    assert client.get_collection("docs").count() > 10
+
+    assert add(client, chunker, "short replacement")["updated"] == 1
+    collection = client.get_collection("docs")
+    assert collection.ids == ["doc1#0"]
+    assert collection.documents == ["short replacement"]
+
+    client.close()
+    reopened = LocalClient(str(tmp_path)).get_collection("docs")
+    assert reopened.ids == ["doc1#0"] and reopened.count() == 1
+    assert [hit["id"] for hit in reopened.search([[17.0, 1.0]], 5)[0]] == ["doc1#0"]
+
+def test_rerank_runs_queries_concurrently(tmp_path, monkeypatch):
+    def slow_rerank(query, hits, top_m=None):
+        time.sleep(0.2)
+        return list(reversed(hits))
+
+    monkeypatch.setattr(local_client, "rerank_results", slow_rerank)
+    client = LocalClient(str(tmp_path))
+    client.create_collection("docs")
+    client.add_documents("docs", ["a", "b"], ids=["a", "b"], embeddings=[[1.0, 0.0], [0.0, 1.0]])
+
+    start = time.perf_counter()
+    results = client.query("docs", ["q"] * 4, n_results=2, rerank=True, query_embeddings=[[1.0, 0.0]] * 4)
+    assert time.perf_counter() - start < 0.6
+    assert results["ids"] == [["b", "a"]] * 4
@@ -0,0 +1,26 @@
+import pytest
+from database.milvus_filters import build_expr, where_to_expr
+
+def test_comparisons_and_membership():
+    assert where_to_expr({"year": {"$gte": 2020}}) == 'metadata["year"] >= 2020'
+    assert where_to_expr({"tag": {"$in": ["a", "b"]}}) == 'metadata["tag"] in ["a", "b"]'
+    assert where_to_expr({"flag": True}) == 'metadata["flag"] == true'
+
+def test_logical_operators_nest():
+    expr = where_to_expr({"$or": [{"a": 1}, {"$and": [{"b": 2}, {"c": {"$ne": "x"}}]}]})
+    assert expr == '((metadata["a"] == 1) or (((metadata["b"] == 2) and (metadata["c"] != "x"))))'
+
+def test_partition_key_uses_scalar_field():
+    assert where_to_expr({"tenant": 7}, partition_key="tenant") == 'partition_key == "7"'
+    assert where_to_expr({"tenant": {"$in": [1, 2]}}, partition_key="tenant") == 'partition_key in ["1", "2"]'
+
+def test_strings_are_quoted():
+    assert where_to_expr({"name": 'a" or 1 == 1'}) == 'metadata["name"] == "a\\" or 1 == 1"'
+
+def test_where_document_combines_with_where():
+    assert build_expr({"a": 1}, {"$contains": "x"}) == '((metadata["a"] == 1) and (text like "%x%"))'
+    assert build_expr() == ""
+
+def test_unknown_operator_is_rejected():
+    with pytest.raises(ValueError):
+        where_to_expr({"a": {"$regex": "x"}})
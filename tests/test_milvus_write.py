@@ -0,0 +1,72 @@
+import json
+import threading
+from types import SimpleNamespace
+import pytest
+from database.milvus_client import MilvusClient
+from database.upsert import UpsertPlan
+
+class FakeCollection:
+    def __init__(self, rows=None, fail_insert=False):
+        self.rows = dict(rows or {})
+        self.calls = []
+        self.fail_insert = fail_insert
+        self._next = 100
+
+    def insert(self, data):
+        self.calls.append("insert")
+        if self.fail_insert:
+            raise RuntimeError("insert failed")
+        keys = []
+        for doc_id in data[3]:
+            self._next += 1
+            self.rows[self._next] = doc_id
+            keys.append(self._next)
+        return SimpleNamespace(primary_keys=keys)
+
+    def query(self, expr, output_fields, consistency_level=None):
+        doc_ids = json.loads(expr.split(" in ", 1)[1])
+        return [{"id": pk} for pk, doc_id in self.rows.items() if doc_id in doc_ids]
+
+    def delete(self, expr):
+        self.calls.append("delete")
+        for pk in json.loads(expr.split(" in ", 1)[1]):
+            self.rows.pop(pk, None)
+
+    def flush(self):
+        pass
+
+def make_client(collection):
+    client = MilvusClient.__new__(MilvusClient)
+    client._lock = threading.RLock()
+    client._write_locks = {}
+    client._batch_size = 100
+    client._lookup_batch_size = 1000
+    client._residency = SimpleNamespace(acquire=lambda collection: None)
+    client._collection_cache = {"docs": {
+        "collection": collection, "fields": ["id", "embedding", "text", "metadata", "doc_id", "content_hash"],
+        "partition_key": None, "validated": True
+    }}
+    return client
+
+def test_replaced_rows_are_deleted_after_the_insert():
+    collection = FakeCollection({1: "a"})
+    plan = UpsertPlan("docs", ["new a"], ids=["a"]).resolve({"a": [1]}, {"a": "old"})
+    make_client(collection).write_documents(plan, [[0.0]])
+    assert collection.calls == ["insert", "delete"]
+    assert list(collection.rows.values()) == ["a"] and 1 not in collection.rows
+
+def test_failed_insert_keeps_the_old_rows():
+    collection = FakeCollection({1: "a"}, fail_insert=True)
+    plan = UpsertPlan("docs", ["new a"], ids=["a"]).resolve({"a": [1]}, {"a": "old"})
+    with pytest.raises(RuntimeError):
+        make_client(collection).write_documents(plan, [[0.0]])
+    assert collection.rows == {1: "a"}
+
+def test_concurrent_inserts_of_one_id_leave_a_single_row():
+    collection = FakeCollection()
+    client = make_client(collection)
+    first = UpsertPlan("docs", ["one"], ids=["a"]).resolve({}, {})
+    second = UpsertPlan("docs", ["two"], ids=["a"]).resolve({}, {})
+    client.write_documents(first, [[0.0]])
+    client.write_documents(second, [[1.0]])
+    assert list(collection.rows.values()) == ["a"]
@@ -0,0 +1,32 @@
+from services.result_cache import QueryResultCache
+
+def test_bump_in_one_worker_invalidates_another(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE_SHARED_PATH", str(tmp_path / "generations"))
+    first, second = QueryResultCache(), QueryResultCache()
+    params = {"n_results": 1}
+
+    first.put("local", "docs", ["q"], params, {"ids": [["a"]]}, first.generation("local", "docs"))
+    assert first.get("local", "docs", ["q"], params) == {"ids": [["a"]]}
+
+    second.bump("local", "docs")
+    assert first.generation("local", "docs") == second.generation("local", "docs") != 0
+    assert first.get("local", "docs", ["q"], params) is None
+
+def test_disabled_without_shared_path_or_single_worker_opt_in(monkeypatch):
+    monkeypatch.delenv("RESULT_CACHE_SHARED_PATH", raising=False)
+    monkeypatch.delenv("RESULT_CACHE_SINGLE_WORKER", raising=False)
+    assert not QueryResultCache().enabled
+    monkeypatch.setenv("RESULT_CACHE_SINGLE_WORKER", "true")
+    assert QueryResultCache().enabled
+
+def test_cached_results_are_copies(monkeypatch):
+    monkeypatch.delenv("RESULT_CACHE_SHARED_PATH", raising=False)
+    monkeypatch.setenv("RESULT_CACHE_SINGLE_WORKER", "true")
+    cache = QueryResultCache()
+    params = {"n_results": 1}
+    results = {"ids": [["a"]]}
+
+    cache.put("local", "docs", ["q"], params, results, cache.generation("local", "docs"))
+    results["ids"][0].append("b")
+    cache.get("local", "docs", ["q"], params)["ids"][0].append("c")
+    assert cache.get("local", "docs", ["q"], params) == {"ids": [["a"]]}
@@ -0,0 +1,44 @@
+import time
+from services.scheduler import AIMDLimiter, TokenBucket, classify_error
+
+def test_token_bucket_delays_once_burst_is_spent():
+    bucket = TokenBucket(rate=100, capacity=2)
+    assert bucket._reserve(1) == 0
+    assert bucket._reserve(1) == 0
+    assert 0 < bucket._reserve(1) <= 0.011
+
+def test_token_bucket_without_rate_never_waits():
+    bucket = TokenBucket(rate=0)
+    assert bucket._reserve(1000) == 0
+
+def test_aimd_grows_additively_and_halves_on_overload():
+    limiter = AIMDLimiter(initial=4, minimum=1, maximum=8)
+    limiter.acquire()
+    limiter.release(latency=0.01)
+    assert limiter.limit == 4.25
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 2.125
+    assert limiter.in_flight == 0
+
+def test_aimd_limit_caps_in_flight():
+    limiter = AIMDLimiter(initial=2, minimum=1, maximum=2)
+    assert limiter._try_acquire() and limiter._try_acquire()
+    assert not limiter._try_acquire()
+
+def test_aimd_backs_off_once_per_window():
+    limiter = AIMDLimiter(initial=8, minimum=1, maximum=8, latency_target=10)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(overloaded=True)
+    assert limiter.limit == 4
+
+class _Error(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+def test_classify_error():
+    assert classify_error(_Error(429)) == "throttled"
+    assert classify_error(_Error(503)) == "server_error"
+    assert classify_error(_Error(400)) is None
+    assert classify_error(TimeoutError()) == "timeout"
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from services.shared_cache import SharedTable
+
+def key(n: int) -> bytes:
+    return n.to_bytes(16, "little")
+
+def test_writes_are_visible_to_another_mapping(tmp_path):
+    path = str(tmp_path / "table")
+    writer, reader = SharedTable(path, 64), SharedTable(path, 64)
+    writer.put(key(1), np.arange(4, dtype=np.float32))
+    reader._last_attach = 0
+    assert reader.get(key(1)).tolist() == [0, 1, 2, 3]
+    assert reader.get(key(2)) is None
+
+def test_full_probe_window_evicts(tmp_path):
+    table = SharedTable(str(tmp_path / "table"), 16, width=1)
+    for n in range(9):
+        table.put(key(n * 16), np.array([n], dtype=np.float32))
+    assert table.stats()["evictions"] == 1
+    assert table.get(key(8 * 16)).tolist() == [8]
+
+def test_torn_slot_reads_as_miss(tmp_path):
+    table = SharedTable(str(tmp_path / "table"), 16, width=1)
+    table.put(key(3), np.array([1.0], dtype=np.float32))
+    slot = table._start(key(3))
+    table._seq[slot] += 1
+    assert table.get(key(3)) is None
+
+def test_mismatched_width_is_rejected(tmp_path):
+    path = str(tmp_path / "table")
+    SharedTable(path, 16, width=2)
+    with pytest.raises(ValueError):
+        SharedTable(path, 16, width=3)
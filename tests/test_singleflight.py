@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from services.singleflight import SingleFlight
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def slow():
+        calls.append("leader")
+        await asyncio.sleep(10)
+
+    async def fast():
+        calls.append("follower")
+        return "value"
+
+    async def run():
+        leader = asyncio.create_task(flight.ado("key", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.ado("key", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "value"
+    assert calls == ["leader", "follower"]
+
+def test_leader_error_is_shared_with_followers():
+    flight = SingleFlight("test")
+    async def run():
+        gate = asyncio.Event()
+
+        async def failing():
+            await gate.wait()
+            raise ValueError("boom")
+
+        leader = asyncio.create_task(flight.ado("key", failing))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.ado("key", failing))
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert results[0] is results[1]
@@ -0,0 +1,22 @@
+from database.upsert import UpsertPlan, content_hash
+
+def test_content_hash_ignores_empty_metadata():
+    assert content_hash("a", {}) == content_hash("a", None)
+    assert content_hash("a", {"k": 1}) != content_hash("a")
+
+def test_resolve_splits_inserts_updates_and_unchanged():
+    plan = UpsertPlan("docs", ["same", "changed", "new"], ids=["1", "2", "3"])
+    plan.resolve({"1": ["pk1"], "2": ["pk2"]}, {"1": content_hash("same"), "2": content_hash("old")})
+    assert plan.ids == ["2", "3"]
+    assert plan.replaced == {"2": ["pk2"]}
+    assert plan.summary() == {"inserted": 1, "updated": 1, "unchanged": 1}
+
+def test_duplicate_ids_keep_the_last_document():
+    plan = UpsertPlan("docs", ["first", "second"], ids=["x", "x"]).resolve({}, {})
+    assert plan.documents == ["second"]
+    assert plan.summary() == {"inserted": 1, "updated": 0, "unchanged": 1}
+    assert plan.select_embeddings([[0.0], [1.0]]) == [[1.0]]
+
+def test_ids_default_to_content_hashes():
+    plan = UpsertPlan("docs", ["a"], [{"k": 1}]).resolve({}, {})
+    assert plan.ids == [content_hash("a", {"k": 1})]
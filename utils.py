@@ -1,11 +1,252 @@
 import os
+import asyncio
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from services.reranker import Reranker
 from services.embedder import Embedder
+from services.batcher import MicroBatcher
+from services.embedding_cache import EmbeddingCache
+from services.rerank_cache import RerankCache
+from services.result_cache import QueryResultCache
+from services.singleflight import SingleFlight
+
+_batcher = None
+_embedding_cache = None
+_rerank_cache = None
+_result_cache = None
+_executor = None
+_embedding_dimension = None
+_lock = threading.Lock()
+_embedding_flight = SingleFlight("embedding")
+_rerank_flight = SingleFlight("rerank")
+search_flight = SingleFlight("search")
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("VECTOR_STORE_MAX_WORKERS", 16)),
+                    thread_name_prefix="vector-store"
+                )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, fn, *args, **kwargs))
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                embedder = Embedder()
+                _batcher = MicroBatcher(embedder.generate_embeddings, max_concurrency=embedder.max_concurrency)
+    return _batcher
+
+def get_embedding_cache():
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
+
+def get_rerank_cache():
+    global _rerank_cache
+    if _rerank_cache is None:
+        with _lock:
+            if _rerank_cache is None:
+                _rerank_cache = RerankCache()
+    return _rerank_cache
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None:
+        with _lock:
+            if _result_cache is None:
+                _result_cache = QueryResultCache()
+    return _result_cache
+
+def _embedding_model():
+    return Embedder().model
+
+def _use_microbatcher():
+    return os.getenv("EMBEDDING_MICROBATCH", "true").lower() == "true"
+
+def _lookup_embeddings(texts):
+    cache = get_embedding_cache()
+    model = _embedding_model()
+    embeddings = [cache.get(model, text) for text in texts]
+    missing = list(dict.fromkeys((model, text) for text, embedding in zip(texts, embeddings) if embedding is None))
+    owned, waiting = _embedding_flight.claim(missing)
+    return embeddings, owned, waiting
+
+def _store_embeddings(owned, generated):
+    cache = get_embedding_cache()
+    for (model, text), embedding in zip(owned, generated):
+        cache.put(model, text, embedding)
+    _embedding_flight.resolve(owned, generated)
+
+def _merge_embeddings(texts, embeddings, resolved):
+    model = _embedding_model()
+    return [embedding if embedding is not None else resolved[(model, text)]
+            for text, embedding in zip(texts, embeddings)]
+
+def _generate_owned(owned):
+    texts = [text for _, text in owned]
+    if len(texts) == 1 and _use_microbatcher():
+        return [_get_batcher()(texts[0])]
+    return Embedder().generate_embeddings(texts)
+
+async def _agenerate_owned(owned):
+    texts = [text for _, text in owned]
+    if len(texts) == 1 and _use_microbatcher():
+        return [await asyncio.wrap_future(_get_batcher().submit(texts[0]))]
+    return await Embedder().agenerate_embeddings(texts)
+
+def generate_embeddings(texts):
+    embeddings, owned, waiting = _lookup_embeddings(texts)
+    resolved = {}
+    if owned:
+        try:
+            generated = _generate_owned(owned)
+        except Exception as e:
+            _embedding_flight.fail(owned, e)
+            raise
+        except BaseException:
+            _embedding_flight.abandon(owned)
+            raise
+        _store_embeddings(owned, generated)
+        resolved.update(zip(owned, generated))
+    waited, abandoned = _embedding_flight.wait(waiting)
+    resolved.update(waited)
+    if abandoned:
+        resolved.update(zip(abandoned, generate_embeddings([text for _, text in abandoned])))
+    return _merge_embeddings(texts, embeddings, resolved)
 
 def generate_embedding(text):
-    embedder = Embedder()
-    return embedder.generate_embedding(text)
+    return generate_embeddings([text])[0]
+
+def get_embedding_dimension():
+    global _embedding_dimension
+    if _embedding_dimension is None:
+        configured = os.getenv("EMBEDDING_DIMENSION")
+        _embedding_dimension = int(configured) if configured else len(generate_embedding("dimension probe"))
+    return _embedding_dimension
+
+async def agenerate_embeddings(texts):
+    embeddings, owned, waiting = _lookup_embeddings(texts)
+    resolved = {}
+    if owned:
+        try:
+            generated = await _agenerate_owned(owned)
+        except Exception as e:
+            _embedding_flight.fail(owned, e)
+            raise
+        except BaseException:
+            _embedding_flight.abandon(owned)
+            raise
+        _store_embeddings(owned, generated)
+        resolved.update(zip(owned, generated))
+    waited, abandoned = await _embedding_flight.await_all(waiting)
+    resolved.update(waited)
+    if abandoned:
+        resolved.update(zip(abandoned, await agenerate_embeddings([text for _, text in abandoned])))
+    return _merge_embeddings(texts, embeddings, resolved)
 
-def rerank_results(query, documents):
+async def agenerate_embedding(text):
+    return (await agenerate_embeddings([text]))[0]
+
+def _split_rerank_candidates(documents, top_m=None):
+    top_m = top_m if top_m is not None else int(os.getenv("RERANK_TOP_M", 0))
+    if top_m and top_m < len(documents):
+        return documents[:top_m], documents[top_m:]
+    return documents, []
+
+def _lookup_rerank_scores(query, documents):
     reranker = Reranker()
-    return reranker.rerank(query, documents)
\ No newline at end of file
+    texts = [Reranker.document_text(doc) for doc in documents]
+    keys = [
+        RerankCache.make_key(reranker.model, query, doc.get("id", "") if isinstance(doc, dict) else "", text)
+        for doc, text in zip(documents, texts)
+    ]
+    scores = get_rerank_cache().get_many(keys)
+    missing = {}
+    for i, (key, score) in enumerate(zip(keys, scores)):
+        if score is None:
+            missing.setdefault(key, i)
+    owned, waiting = _rerank_flight.claim(list(missing))
+    return keys, texts, scores, {key: missing[key] for key in owned}, waiting
+
+def _store_rerank_scores(owned, fresh_scores):
+    get_rerank_cache().put_many(owned, fresh_scores)
+    _rerank_flight.resolve(owned, fresh_scores)
+
+def _sort_by_scores(candidates, rest, scores):
+    order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    return [candidates[i] for i in order] + rest
+
+def _merge_rerank_scores(keys, scores, resolved):
+    return [score if score is not None else resolved[key] for key, score in zip(keys, scores)]
+
+def _rerank_scores(query, candidates):
+    keys, texts, scores, owned, waiting = _lookup_rerank_scores(query, candidates)
+    resolved = {}
+    if owned:
+        try:
+            fresh_scores = Reranker().score(query, [texts[i] for i in owned.values()])
+        except Exception as e:
+            _rerank_flight.fail(list(owned), e)
+            raise
+        except BaseException:
+            _rerank_flight.abandon(list(owned))
+            raise
+        _store_rerank_scores(list(owned), fresh_scores)
+        resolved.update(zip(owned, fresh_scores))
+    waited, abandoned = _rerank_flight.wait(waiting)
+    resolved.update(waited)
+    if abandoned:
+        retry = [candidates[keys.index(key)] for key in abandoned]
+        resolved.update(zip(abandoned, _rerank_scores(query, retry)))
+    return _merge_rerank_scores(keys, scores, resolved)
+
+async def _arerank_scores(query, candidates):
+    keys, texts, scores, owned, waiting = _lookup_rerank_scores(query, candidates)
+    resolved = {}
+    if owned:
+        try:
+            fresh_scores = await Reranker().ascore(query, [texts[i] for i in owned.values()])
+        except Exception as e:
+            _rerank_flight.fail(list(owned), e)
+            raise
+        except BaseException:
+            _rerank_flight.abandon(list(owned))
+            raise
+        _store_rerank_scores(list(owned), fresh_scores)
+        resolved.update(zip(owned, fresh_scores))
+    waited, abandoned = await _rerank_flight.await_all(waiting)
+    resolved.update(waited)
+    if abandoned:
+        retry = [candidates[keys.index(key)] for key in abandoned]
+        resolved.update(zip(abandoned, await _arerank_scores(query, retry)))
+    return _merge_rerank_scores(keys, scores, resolved)
+
+def rerank_results(query, documents, top_m=None):
+    candidates, rest = _split_rerank_candidates(documents, top_m)
+    return _sort_by_scores(candidates, rest, _rerank_scores(query, candidates))
+
+async def arerank_results(query, documents, top_m=None):
+    candidates, rest = _split_rerank_candidates(documents, top_m)
+    return _sort_by_scores(candidates, rest, await _arerank_scores(query, candidates))